@@ -1,7 +1,7 @@
 from django.core.management.base import NoArgsCommand
 
-from bugmail.tasks import update_bugs
 from bugmail.utils import get_bugmail_stdin, store_messages
+from scrum.tasks import queue_update_bugs
 
 
 class Command(NoArgsCommand):
@@ -11,4 +11,4 @@ class Command(NoArgsCommand):
         msgs = get_bugmail_stdin()
         bugids = store_messages(msgs)
         if bugids:
-            update_bugs.delay(bugids)
+            queue_update_bugs(bugids)
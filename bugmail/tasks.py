@@ -7,7 +7,7 @@ from celery import task
 
 from bugmail.models import BugmailStat
 from bugmail.utils import get_bugmails, store_messages
-from scrum.tasks import update_bugs
+from scrum.tasks import queue_update_bugs
 
 
 log = logging.getLogger(__name__)
@@ -21,7 +21,7 @@ def get_bugmail_messages():
     msgs = get_bugmails()
     bugids = store_messages(msgs)
     if bugids:
-        update_bugs.delay(bugids)
+        queue_update_bugs(bugids)
 
 
 @task(name='clean_bugmail_log')
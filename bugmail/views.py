@@ -12,8 +12,8 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView, View
 
 from bugmail.models import BugmailStat
-from bugmail.tasks import update_bugs
 from bugmail.utils import get_bugmail_str, store_messages
+from scrum.tasks import queue_update_bugs
 from scrum.utils import date_range, date_to_js
 
 
@@ -38,7 +38,7 @@ class ProcessBugmail(View):
             bugids = store_messages(msgs)
             if bugids:
                 log.debug('Got bugmail for bug {0} via view'.format(bugids[0]))
-                update_bugs.delay(bugids)
+                queue_update_bugs(bugids)
             return HttpResponse()
         else:
             return HttpResponseBadRequest()
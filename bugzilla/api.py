@@ -1,11 +1,24 @@
+import httplib
+import json
 import logging
 import os
+import Queue
+import re
+import socket
+import time
 import xmlrpclib
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import count
 
 from django.conf import settings
 from django.core.cache import cache
-from django.utils.timezone import make_aware, utc
+from django.utils.timezone import is_aware, make_aware, make_naive, utc
+
+from bugzilla.ratelimit import AdaptiveRateLimiter
+from bugzilla.stats import api_stats
 
 
 def get_setting_or_env(name, default=None):
@@ -17,10 +30,31 @@ def get_setting_or_env(name, default=None):
 
 log = logging.getLogger(__name__)
 BZ_URL = get_setting_or_env('BUGZILLA_API_URL')
+BZ_JSONRPC_URL = get_setting_or_env('BUGZILLA_JSONRPC_URL')
+# 'xmlrpc' or 'jsonrpc'
+BZ_PROTOCOL = get_setting_or_env('BUGZILLA_PROTOCOL', 'xmlrpc')
 BZ_USER = get_setting_or_env('BUGZILLA_USER')
 BZ_PASS = get_setting_or_env('BUGZILLA_PASS')
+BZ_WORKERS = int(get_setting_or_env('BUGZILLA_API_WORKERS', 3))
+BZ_POOL_SIZE = int(get_setting_or_env('BUGZILLA_POOL_SIZE', 10))
+BZ_POOL_TIMEOUT = int(get_setting_or_env('BUGZILLA_POOL_TIMEOUT', 60))
+BZ_MULTICALL = bool(int(get_setting_or_env('BUGZILLA_MULTICALL', 0)))
+# calls per second shared by all processes. 0 turns off rate limiting.
+BZ_MAX_RATE = int(get_setting_or_env('BUGZILLA_MAX_RATE', 20))
+BZ_SLOW_SECONDS = int(get_setting_or_env('BUGZILLA_SLOW_SECONDS', 15))
+# seconds without a response before a call fails with socket.timeout.
+BZ_SOCKET_TIMEOUT = float(get_setting_or_env('BUGZILLA_SOCKET_TIMEOUT',
+                                             60))
+# HTTP statuses Bugzilla (or its load balancers) use when overloaded.
+OVERLOADED_STATUSES = (429, 502, 503, 504)
 SESSION_COOKIES_CACHE_KEY = 'bugzilla-session-cookies'
 PRODUCTS_CACHE = None
+PRODUCTS_INDEX = None
+# the component for a whole product, same as scrum.models.ALL_COMPONENTS.
+ALL_COMPONENTS = '__ALL__'
+PRODUCT_SEPARATOR = ' :: '
+WORD_SPLIT_RE = re.compile(r'[\s:/_.-]+')
+METHOD_NAME_RE = re.compile(r'<methodName>([^<]+)</methodName>')
 BUG_OPEN_STATUSES = settings.BUG_OPEN_STATUSES
 BUG_CLOSED_STATUSES = settings.BUG_CLOSED_STATUSES
 BZ_FIELDS = [
@@ -57,6 +91,18 @@ UNWANTED_COMPONENT_FIELDS = [
     'flag_types',
 ]
 UNWANTED_COMPONENT_FIELDS = ['components.' + i for i in UNWANTED_COMPONENT_FIELDS]
+JSON_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+JSON_DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$')
+# the fields that are dateTime values over XML-RPC.
+JSON_DATETIME_FIELDS = frozenset([
+    'creation_time',
+    'last_change_time',
+    'when',
+    'time',
+    'creation_date',
+    'modification_date',
+    'last_seen_date',
+])
 
 
 def clean_bug_data(bug):
@@ -70,9 +116,20 @@ def clean_bug_data(bug):
     for k, v in bug.items():
         if isinstance(v, datetime):
             bug[k] = make_aware(v, utc)
-    if 'history' in bug:
-        for h in bug['history']:
+    for key in ('history', 'new_history'):
+        for h in bug.get(key, []):
             h['when'] = make_aware(h['when'], utc)
+    for c in bug.get('new_comments', []):
+        c['time'] = make_aware(c['time'], utc)
+
+
+def naive_utc(dt):
+    """
+    Return `dt` as Bugzilla expects times in queries: UTC without tz info.
+    """
+    if dt is not None and is_aware(dt):
+        return make_naive(dt, utc)
+    return dt
 
 
 def is_closed(status):
@@ -83,28 +140,173 @@ def is_open(status):
     return status in BUG_OPEN_STATUSES
 
 
+class ProductIndex(object):
+    """
+    Search index of the 'Product :: Component' names in a product catalog.
+
+    Every word of every name is kept in a sorted list so that the names
+    with a word starting with the search term are found by bisection.
+    Names only containing the term are found by a scan when there aren't
+    enough of those.
+    """
+
+    def __init__(self, products):
+        names = []
+        for product in sorted(products, key=lambda p: p['name']):
+            components = [c['name'] for c in product['components']]
+            for component in [ALL_COMPONENTS] + sorted(components):
+                names.append(product['name'] + PRODUCT_SEPARATOR + component)
+        self.names = names
+        self.lower_names = [name.lower() for name in names]
+        words = set()
+        for i, name in enumerate(self.lower_names):
+            for word in WORD_SPLIT_RE.split(name):
+                if word:
+                    words.add((word, i))
+        self.words = sorted(words)
+
+    def _prefix_matches(self, term):
+        """Return the indexes of the names with a word starting with term."""
+        matches = set()
+        pos = bisect_left(self.words, (term,))
+        while pos < len(self.words) and self.words[pos][0].startswith(term):
+            matches.add(self.words[pos][1])
+            pos += 1
+        return matches
+
+    def search(self, query, limit=20):
+        """
+        Return up to `limit` names matching all of the words in `query`,
+        best matches first.
+        """
+        query = query.strip().lower()
+        terms = [t for t in WORD_SPLIT_RE.split(query) if t]
+        if not terms:
+            return []
+        matches = self._prefix_matches(terms[0])
+        for term in terms[1:]:
+            matches &= self._prefix_matches(term)
+        ranked = [(0 if self.lower_names[i].startswith(query) else 1, i)
+                  for i in matches]
+        if len(ranked) < limit:
+            ranked.extend((2, i) for i, name in enumerate(self.lower_names)
+                          if i not in matches and
+                          all(t in name for t in terms))
+        return [self.names[i] for rank, i in sorted(ranked)[:limit]]
+
+
+class ByteCountingResponse(object):
+    """
+    Wraps an `httplib.HTTPResponse` to count the bytes read from it.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self.bytes_read = 0
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
 class SessionTransport(xmlrpclib.SafeTransport):
     """
-    XML-RPC HTTPS transport that stores auth cookies in the cache.
+    XML-RPC HTTPS transport that stores auth cookies in the cache, and
+    records the time, sizes and faults of each call in `api_stats`.
     """
     _session_cookies = None
+    _response = None
+    _parse_time = 0
+
+    def __init__(self, use_datetime=0, secure=True,
+                 socket_timeout=BZ_SOCKET_TIMEOUT):
+        xmlrpclib.SafeTransport.__init__(self, use_datetime)
+        # allow plain HTTP for local test servers.
+        self.secure = secure
+        self.socket_timeout = socket_timeout
+
+    def request(self, host, handler, request_body, verbose=0):
+        method = METHOD_NAME_RE.search(request_body)
+        method = method.group(1) if method else 'unknown'
+        return self.timed_request(method, host, handler, request_body,
+                                  verbose)
+
+    def timed_request(self, method, host, handler, request_body, verbose=0):
+        """
+        Send the request and record its stats under `method`.
+        """
+        self._response = None
+        self._parse_time = 0
+        fault_code = None
+        start = time.time()
+        try:
+            return xmlrpclib.SafeTransport.request(self, host, handler,
+                                                   request_body, verbose)
+        except xmlrpclib.Fault as e:
+            fault_code = e.faultCode
+            raise
+        except Exception as e:
+            fault_code = e.__class__.__name__
+            raise
+        finally:
+            bytes_received = self._response.bytes_read if self._response else 0
+            api_stats.record(method, time.time() - start,
+                             bytes_sent=len(request_body),
+                             bytes_received=bytes_received,
+                             parse_seconds=self._parse_time,
+                             fault_code=fault_code)
+
+    def parse_response(self, response):
+        self._response = response = ByteCountingResponse(response)
+        self.save_cookies(response)
+        start = time.time()
+        try:
+            return self._parse_response(response)
+        finally:
+            self._parse_time = time.time() - start
+
+    def _parse_response(self, response):
+        return xmlrpclib.Transport.parse_response(self, response)
+
+    def make_connection(self, host):
+        # the same as xmlrpclib, with a timeout so that a stalled Bugzilla
+        # can't hang a worker.
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        if self.secure:
+            kwargs = dict(x509 or {})
+            # python 2.7.9+ verifies certificates with an ssl context.
+            if getattr(self, 'context', None) is not None:
+                kwargs['context'] = self.context
+            connection = httplib.HTTPSConnection(
+                chost, None, timeout=self.socket_timeout, **kwargs)
+        else:
+            connection = httplib.HTTPConnection(
+                chost, timeout=self.socket_timeout)
+        self._connection = host, connection
+        return connection
 
     @property
     def session_cookies(self):
-        if self._session_cookies is None:
-            cookie = cache.get(SESSION_COOKIES_CACHE_KEY)
-            if cookie:
-                self._session_cookies = cookie
+        # always check the cache since other transports in the pool (or
+        # other processes) may have logged in since we last looked.
+        cookie = cache.get(SESSION_COOKIES_CACHE_KEY)
+        if cookie:
+            self._session_cookies = cookie
         return self._session_cookies
 
-    def parse_response(self, response):
+    def save_cookies(self, response):
         cookies = self.get_cookies(response)
         if cookies:
             self._session_cookies = cookies
             cache.set(SESSION_COOKIES_CACHE_KEY,
                       self._session_cookies, 0)
             log.debug('Got cookie: %s', self._session_cookies)
-        return xmlrpclib.Transport.parse_response(self, response)
 
     def send_host(self, connection, host):
         cookies = self.session_cookies
@@ -124,8 +326,302 @@ class SessionTransport(xmlrpclib.SafeTransport):
         return cookie_headers
 
 
+class JSONRPCEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.strftime(JSON_DATETIME_FORMAT)
+        return super(JSONRPCEncoder, self).default(obj)
+
+
+def parse_json_datetimes(obj):
+    """
+    `object_hook` that turns the date fields of Bugzilla's JSON-RPC
+    responses into the same naive UTC datetimes that xmlrpclib returns.
+    Other strings are left alone, even if they look like dates.
+    """
+    for k in JSON_DATETIME_FIELDS.intersection(obj):
+        v = obj[k]
+        if isinstance(v, basestring) and JSON_DATETIME_RE.match(v):
+            obj[k] = datetime.strptime(v, JSON_DATETIME_FORMAT)
+    return obj
+
+
+class JSONRPCTransport(SessionTransport):
+    """
+    Transport that talks to Bugzilla's JSON-RPC endpoint on behalf of an
+    `xmlrpclib.ServerProxy`, so that `BugzillaAPI` works unchanged.
+
+    The (small) XML-RPC requests are translated to JSON-RPC, and the
+    responses are decoded by the json module, which is a lot cheaper than
+    xmlrpclib's parser on large payloads. The whole response is read
+    before it's decoded, so the memory used is about the same.
+    """
+
+    def __init__(self, use_datetime=0, secure=True,
+                 socket_timeout=BZ_SOCKET_TIMEOUT):
+        SessionTransport.__init__(self, use_datetime, secure,
+                                  socket_timeout)
+        self._request_ids = count(1)
+
+    def request(self, host, handler, request_body, verbose=0):
+        params, method = xmlrpclib.loads(request_body, use_datetime=True)
+        request_body = json.dumps({
+            'method': method,
+            'params': params,
+            'id': next(self._request_ids),
+        }, cls=JSONRPCEncoder)
+        return self.timed_request(method, host, handler, request_body,
+                                  verbose)
+
+    def send_content(self, connection, request_body):
+        connection.putheader('Content-Type', 'application/json')
+        connection.putheader('Content-Length', str(len(request_body)))
+        connection.endheaders(request_body)
+
+    def _parse_response(self, response):
+        if response.getheader('Content-Encoding', '') == 'gzip':
+            response = xmlrpclib.GzipDecodedResponse(response)
+        object_hook = parse_json_datetimes if self._use_datetime else None
+        response = json.load(response, object_hook=object_hook)
+        error = response.get('error')
+        if error:
+            raise xmlrpclib.Fault(error.get('code'), error.get('message'))
+        # ServerProxy expects a tuple of params like xmlrpclib.loads
+        return response['result'],
+
+
+class TransportPool(object):
+    """
+    Thread and greenlet safe pool of transports. Each transport keeps its
+    own keep-alive connection open between requests.
+    """
+
+    def __init__(self, transport_class=SessionTransport, size=BZ_POOL_SIZE,
+                 timeout=BZ_POOL_TIMEOUT, **transport_kwargs):
+        self.transport_class = transport_class
+        self.size = size
+        self.timeout = timeout
+        self.transport_kwargs = transport_kwargs
+        self._reset()
+
+    def _reset(self):
+        # transports are created lazily. the placeholders go in first so
+        # that already connected transports are always checked out first.
+        self._pid = os.getpid()
+        self._pool = Queue.LifoQueue(self.size)
+        for i in range(self.size):
+            self._pool.put(None)
+
+    def get(self):
+        # don't share sockets with a parent process (e.g. celery workers).
+        if self._pid != os.getpid():
+            self._reset()
+        transport = self._pool.get(timeout=self.timeout)
+        if transport is None:
+            transport = self.transport_class(**self.transport_kwargs)
+        return transport
+
+    def put(self, transport):
+        self._pool.put(transport)
+
+    @contextmanager
+    def transport(self):
+        """
+        Check out a transport for the duration of the block.
+        """
+        transport = self.get()
+        try:
+            yield transport
+        except xmlrpclib.Fault:
+            raise
+        except Exception:
+            # the connection may be in a bad state.
+            transport.close()
+            raise
+        finally:
+            self.put(transport)
+
+    def close(self):
+        while True:
+            try:
+                transport = self._pool.get_nowait()
+            except Queue.Empty:
+                break
+            if transport is not None:
+                transport.close()
+        self._reset()
+
+
+def is_overloaded_error(error):
+    """
+    Return True if the error means Bugzilla is overloaded or unreachable.
+    """
+    if isinstance(error, xmlrpclib.ProtocolError):
+        return error.errcode in OVERLOADED_STATUSES
+    return isinstance(error, socket.error)
+
+
+class PooledTransport(object):
+    """
+    XML-RPC transport that sends each request using a transport checked
+    out of a `TransportPool`, so that one `ServerProxy` can be shared
+    between threads and greenlets.
+
+    :param rate_limiter: optional `AdaptiveRateLimiter` for the requests.
+    """
+
+    def __init__(self, transport_class=SessionTransport, size=BZ_POOL_SIZE,
+                 timeout=BZ_POOL_TIMEOUT, rate_limiter=None,
+                 **transport_kwargs):
+        self.pool = TransportPool(transport_class, size, timeout,
+                                  **transport_kwargs)
+        self.rate_limiter = rate_limiter
+
+    def request(self, host, handler, request_body, verbose=0):
+        if self.rate_limiter is None:
+            return self._request(host, handler, request_body, verbose)
+        self.rate_limiter.acquire()
+        start = time.time()
+        try:
+            response = self._request(host, handler, request_body, verbose)
+        except Exception as e:
+            if is_overloaded_error(e):
+                self.rate_limiter.failure()
+            raise
+        self.rate_limiter.success(time.time() - start)
+        return response
+
+    def _request(self, host, handler, request_body, verbose=0):
+        with self.pool.transport() as transport:
+            return transport.request(host, handler, request_body, verbose)
+
+    def close(self):
+        self.pool.close()
+
+
 class BugzillaAPI(xmlrpclib.ServerProxy):
     _products_cache_key = 'bugzilla:products:components'
+    # `get_*` method name to the Bugzilla `Bug.*` method it calls.
+    _sub_resource_methods = {
+        'get_history': 'history',
+        'get_comments': 'comments',
+        'get_attachments': 'attachments',
+    }
+
+    def __init__(self, uri, *args, **kwargs):
+        self.use_multicall = kwargs.pop('multicall', BZ_MULTICALL)
+        xmlrpclib.ServerProxy.__init__(self, uri, *args, **kwargs)
+
+    def _sub_resource_kwargs(self, name, since):
+        if since and since.get(name) is not None:
+            return {'new_since': since[name]}
+        return {}
+
+    def _fetch_multicall(self, bug_ids, method_names, get_query=None,
+                         since=None):
+        """
+        Make the `Bug.*` calls behind each of the named methods in a single
+        `system.multicall` request.
+
+        :param bug_ids: list of bug ids passed to every method.
+        :param method_names: list of names of `get_*` methods to call.
+        :param get_query: optional `Bug.get` query to add to the request.
+        :param since: optional dict of method name to the time to fetch
+                      only what's new since.
+        :return: tuple of (`Bug.get` result, dict of method name to its
+                 result), or (None, None) if the server can't multicall.
+        """
+        multicall = xmlrpclib.MultiCall(self)
+        if get_query is not None:
+            multicall.Bug.get(get_query)
+        for name in method_names:
+            bz_method = self._sub_resource_methods[name]
+            query = getattr(self, '_%s_query' % bz_method)(
+                bug_ids, **self._sub_resource_kwargs(name, since))
+            getattr(multicall.Bug, bz_method)(query)
+        try:
+            responses = list(multicall().results)
+        except xmlrpclib.Fault:
+            # faults for single calls are returned in the results, so this
+            # means the server doesn't do multicall at all.
+            log.warning('system.multicall failed. Falling back to single '
+                        'calls.', exc_info=True)
+            self.use_multicall = False
+            return None, None
+
+        bugs = None
+        if get_query is not None:
+            bugs = self._multicall_result(responses.pop(0))
+        results = {}
+        for name, response in zip(method_names, responses):
+            bz_method = self._sub_resource_methods[name]
+            try:
+                result = self._multicall_result(response)
+            except xmlrpclib.Fault:
+                log.exception('Problem getting %s for bug ids: %s',
+                              bz_method, bug_ids)
+                result = {}
+            else:
+                result = getattr(self, '_parse_%s' % bz_method)(result)
+            results[name] = result
+        return bugs, results
+
+    def _multicall_result(self, response):
+        """
+        Return the result of one call in a multicall response, or raise its
+        fault.
+        """
+        if isinstance(response, dict):
+            raise xmlrpclib.Fault(response['faultCode'],
+                                  response['faultString'])
+        return response[0]
+
+    def _fetch_sub_resources(self, bug_ids, method_names, since=None):
+        """
+        Call each of the named methods with `bug_ids`.
+        :return: dict of method name to its result.
+        """
+        results = None
+        if self.use_multicall and method_names:
+            results = self._fetch_multicall(bug_ids, method_names,
+                                            since=since)[1]
+        if results is None:
+            results = self._fetch_concurrently(bug_ids, method_names,
+                                               since)
+        return results
+
+    def _fetch_concurrently(self, bug_ids, method_names, since=None):
+        """
+        Call each of the named methods with `bug_ids` on a bounded pool of
+        worker threads.
+
+        :param bug_ids: list of bug ids passed to every method.
+        :param method_names: list of names of `get_*` methods to call.
+        :param since: optional dict of method name to the time to fetch
+                      only what's new since.
+        :return: dict of method name to its result.
+        """
+        if not method_names:
+            return {}
+
+        stats = api_stats.stats
+
+        def call(name):
+            # record the calls in the stats of the task, not the thread.
+            api_stats.stats = stats
+            return getattr(self, name)(
+                bug_ids, **self._sub_resource_kwargs(name, since))
+
+        max_workers = BZ_WORKERS
+        rate_limiter = getattr(self('transport'), 'rate_limiter', None)
+        if rate_limiter is not None:
+            # fewer threads while Bugzilla is struggling.
+            max_workers = rate_limiter.concurrency(max_workers)
+        num_workers = max(1, min(max_workers, len(method_names)))
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = dict((name, executor.submit(call, name))
+                           for name in method_names)
+        return dict((name, f.result()) for name, f in futures.items())
 
     def login(self, username=None, password=None):
         return self.User.login({
@@ -135,8 +631,8 @@ class BugzillaAPI(xmlrpclib.ServerProxy):
         })
 
     def clear_products_cache(self):
-        global PRODUCTS_CACHE
-        PRODUCTS_CACHE = None
+        global PRODUCTS_CACHE, PRODUCTS_INDEX
+        PRODUCTS_CACHE = PRODUCTS_INDEX = None
         cache.delete(self._products_cache_key)
 
     def get_products(self):
@@ -155,6 +651,23 @@ class BugzillaAPI(xmlrpclib.ServerProxy):
         PRODUCTS_CACHE = products
         return products
 
+    def get_product_index(self):
+        """
+        Return the `ProductIndex` of the product catalog, built once per
+        process.
+        """
+        global PRODUCTS_INDEX
+        products = self.get_products()
+        if PRODUCTS_INDEX is None or PRODUCTS_INDEX[0] is not products:
+            PRODUCTS_INDEX = (products, ProductIndex(products))
+        return PRODUCTS_INDEX[1]
+
+    def search_products(self, query, limit=20):
+        """
+        Return up to `limit` 'Product :: Component' names matching `query`.
+        """
+        return self.get_product_index().search(query, limit)
+
     def get_products_simplified(self):
         products = self.get_products()
         simple = {}
@@ -179,18 +692,74 @@ class BugzillaAPI(xmlrpclib.ServerProxy):
         bugs = self.Bug.search(kwargs)
         return [bug['id'] for bug in bugs.get('bugs', [])]
 
+    def get_bug_change_times(self, **kwargs):
+        """
+        Return a dict of bug id to last change time for the bugs from a
+        search, or for the bugs in `ids`.
+
+        Pass `last_change_time` to only search bugs changed at or after
+        that time.
+        """
+        open_only = kwargs.pop('open_only', False)
+        scrum_only = kwargs.pop('scrum_only', True)
+        kwargs.update({
+            'include_fields': ['id', 'last_change_time'],
+        })
+        if 'ids' in kwargs:
+            kwargs['permissive'] = True
+            bugs = self.Bug.get(kwargs)
+        else:
+            if open_only and 'status' not in kwargs:
+                kwargs['status'] = BUG_OPEN_STATUSES
+            if scrum_only and 'whiteboard' not in kwargs:
+                kwargs['whiteboard'] = ['u=', 'c=', 'p=']
+            if kwargs.get('last_change_time'):
+                kwargs['last_change_time'] = naive_utc(
+                    kwargs['last_change_time'])
+            log.debug('Searching bugs with kwargs: %s', kwargs)
+            bugs = self.Bug.search(kwargs)
+        api_stats.record_faults('Bug.get', bugs.get('faults', []))
+        return dict((bug['id'], make_aware(bug['last_change_time'], utc))
+                    for bug in bugs.get('bugs', []))
+
     def get_bugs(self, **kwargs):
+        """
+        Return the bugs with their history, comments count and attachments.
+
+        Pass `history_since` to only fetch the history entries newer than
+        that time. The bugs then have them as `new_history` in place of
+        `history`.
+
+        Pass `comments_since` to only fetch the comments newer than that
+        time. The bugs then have them as `new_comments`, with their 'time'
+        and 'count', in place of `comments_count`.
+        """
         open_only = kwargs.pop('open_only', False)
         scrum_only = kwargs.pop('scrum_only', True)
-        get_history = kwargs.pop('history', True)
-        get_comments = kwargs.pop('comments', True)
-        get_attachments = kwargs.pop('attachments', True)
+        since = {
+            'get_history': naive_utc(kwargs.pop('history_since', None)),
+            'get_comments': naive_utc(kwargs.pop('comments_since', None)),
+        }
+        method_names = []
+        if kwargs.pop('history', True):
+            method_names.append('get_history')
+        if kwargs.pop('comments', True):
+            method_names.append('get_comments')
+        if kwargs.pop('attachments', True):
+            method_names.append('get_attachments')
         kwargs.update({
             'include_fields': BZ_FIELDS,
         })
+        bugs = results = None
         if 'ids' in kwargs:
             kwargs['permissive'] = True
-            bugs = self.Bug.get(kwargs)
+            if self.use_multicall:
+                # everything in one request.
+                bugs, results = self._fetch_multicall(kwargs['ids'],
+                                                      method_names, kwargs,
+                                                      since)
+            if bugs is None:
+                bugs = self.Bug.get(kwargs)
         else:
             if open_only and 'status' not in kwargs:
                 kwargs['status'] = BUG_OPEN_STATUSES
@@ -199,57 +768,119 @@ class BugzillaAPI(xmlrpclib.ServerProxy):
             log.debug('Searching bugs with kwargs: %s', kwargs)
             bugs = self.Bug.search(kwargs)
 
+        api_stats.record_faults('Bug.get', bugs.get('faults', []))
         bug_ids = [bug['id'] for bug in bugs.get('bugs', [])]
 
         if not bug_ids:
             return bugs
 
         # mix in history, comments, and attachments
-        history = comments = attachments = {}
-        if get_history:
-            history = self.get_history(bug_ids)
-        if get_comments:
-            comments = self.get_comments(bug_ids)
-        if get_attachments:
-            attachments = self.get_attachments(bug_ids)
+        if results is None:
+            results = self._fetch_sub_resources(bug_ids, method_names,
+                                                since)
+        elif bugs.get('faults'):
+            # with bad ids in the batch the sub-resource calls may have
+            # faulted as a whole. retry those with the good ids.
+            retry = [name for name in method_names if not results[name]]
+            results.update(self._fetch_sub_resources(bug_ids, retry, since))
+        history = results.get('get_history', {})
+        comments = results.get('get_comments', {})
+        attachments = results.get('get_attachments', {})
+        history_key = ('history' if since['get_history'] is None
+                       else 'new_history')
         for bug in bugs['bugs']:
-            bug['history'] = history.get(bug['id'], [])
-            bug['comments_count'] = len(comments.get(bug['id'], {})
-                                        .get('comments', []))
+            bug[history_key] = history.get(bug['id'], [])
+            bug_comments = comments.get(bug['id'], {}).get('comments', [])
+            if since['get_comments'] is None:
+                bug['comments_count'] = len(bug_comments)
+            else:
+                bug['new_comments'] = bug_comments
             bug['attachments'] = attachments.get(bug['id'], [])
             clean_bug_data(bug)
         return bugs
 
+    def _attachments_query(self, bug_ids):
+        return {'ids': bug_ids, 'include_fields': BZ_ATTACHMENT_FIELDS}
+
+    def _parse_attachments(self, result):
+        attachments = result.get('bugs')
+        return dict((int(k), v) for k, v in attachments.iteritems())
+
     def get_attachments(self, bug_ids):
         try:
-            attachments = self.Bug.attachments({
-                'ids': bug_ids,
-                'include_fields': BZ_ATTACHMENT_FIELDS}).get('bugs')
+            attachments = self.Bug.attachments(
+                self._attachments_query(bug_ids))
         except xmlrpclib.Fault:
             log.exception('Problem getting attachments for bug ids: %s', bug_ids)
             return {}
+        return self._parse_attachments(attachments)
 
-        return dict((int(k), v) for k, v in attachments.iteritems())
+    def _history_query(self, bug_ids, new_since=None):
+        query = {'ids': bug_ids}
+        if new_since is not None:
+            query['new_since'] = new_since
+        return query
 
-    def get_history(self, bug_ids):
+    def _parse_history(self, result):
+        history = result.get('bugs')
+        return dict((h['id'], h['history']) for h in history)
+
+    def get_history(self, bug_ids, new_since=None):
         try:
-            history = self.Bug.history({'ids': bug_ids}).get('bugs')
+            history = self.Bug.history(self._history_query(bug_ids,
+                                                           new_since))
         except xmlrpclib.Fault:
             log.exception('Problem getting history for bug ids: %s', bug_ids)
             return {}
-        return dict((h['id'], h['history']) for h in history)
+        return self._parse_history(history)
+
+    def _comments_query(self, bug_ids, new_since=None):
+        if new_since is None:
+            return {'ids': bug_ids, 'include_fields': ['id']}
+        # enough to tell which of the comments were already counted.
+        return {'ids': bug_ids, 'new_since': new_since,
+                'include_fields': ['id', 'time', 'count']}
 
-    def get_comments(self, bug_ids):
+    def _parse_comments(self, result):
+        comments = result.get('bugs')
+        return dict((int(bid), cids) for bid, cids in comments.iteritems())
+
+    def get_comments(self, bug_ids, new_since=None):
         try:
-            comments = self.Bug.comments({
-                'ids': bug_ids,
-                'include_fields': ['id'],
-                }).get('bugs')
+            comments = self.Bug.comments(self._comments_query(bug_ids,
+                                                             new_since))
         except xmlrpclib.Fault:
             log.exception('Problem getting comments for bug ids: %s', bug_ids)
             return {}
-        return dict((int(bid), cids) for bid, cids in comments.iteritems())
+        return self._parse_comments(comments)
+
 
+rate_limiter = None
+if BZ_MAX_RATE:
+    rate_limiter = AdaptiveRateLimiter(BZ_MAX_RATE,
+                                       slow_seconds=BZ_SLOW_SECONDS)
 
-bugzilla = BugzillaAPI(BZ_URL, transport=SessionTransport(use_datetime=True),
-                       allow_none=True)
+
+def get_bugzilla_api(protocol=BZ_PROTOCOL, url=None,
+                     rate_limiter=rate_limiter,
+                     socket_timeout=BZ_SOCKET_TIMEOUT):
+    """
+    Return a `BugzillaAPI` using the XML-RPC or JSON-RPC protocol.
+    :param url: Use this endpoint instead of the configured one.
+    :param rate_limiter: `AdaptiveRateLimiter` shared by the processes.
+    :param socket_timeout: Seconds to wait for a response.
+    """
+    if protocol == 'jsonrpc':
+        transport_class = JSONRPCTransport
+        url = url or BZ_JSONRPC_URL
+    else:
+        transport_class = SessionTransport
+        url = url or BZ_URL
+    transport = PooledTransport(transport_class, use_datetime=True,
+                                secure=url.startswith('https:'),
+                                rate_limiter=rate_limiter,
+                                socket_timeout=socket_timeout)
+    return BugzillaAPI(url, transport=transport, allow_none=True)
+
+
+bugzilla = get_bugzilla_api()
@@ -0,0 +1,308 @@
+"""
+A stand-in Bugzilla XML-RPC and JSON-RPC server for exercising and
+benchmarking the sync code without talking to the real Bugzilla.
+
+It serves a corpus of bugs, either recorded from a real Bugzilla (see the
+`record_bugzilla` management command) or generated by `synthetic_corpus`,
+and can add latency and inject faults.
+"""
+import json
+import logging
+import random
+import time
+import xmlrpclib
+from datetime import datetime, timedelta
+from SimpleXMLRPCServer import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+from SocketServer import ThreadingMixIn
+
+from bugzilla.api import (JSON_DATETIME_FORMAT, JSON_DATETIME_RE,
+                          JSONRPCEncoder, parse_json_datetimes)
+
+
+log = logging.getLogger(__name__)
+FAULT_INVALID_BUG = 101
+FAULT_UNAUTHORIZED = 102
+STATUSES = ['NEW', 'ASSIGNED', 'REOPENED', 'RESOLVED', 'VERIFIED']
+
+
+def load_corpus(path):
+    """
+    Load a corpus from a JSON file like `scrum/test_data/bugzilla_data.json`.
+    :return: dict with 'bugs' and 'products' lists.
+    """
+    with open(path) as corpus_file:
+        corpus = json.load(corpus_file, object_hook=parse_json_datetimes)
+    corpus.setdefault('products', [])
+    return corpus
+
+
+def synthetic_corpus(num_bugs=1000, num_products=5, num_components=10,
+                     history_length=20, seed=0):
+    """
+    Generate a corpus of realistic looking bugs.
+    :return: dict with 'bugs' and 'products' lists.
+    """
+    rand = random.Random(seed)
+    start = datetime(2012, 1, 1)
+    products = []
+    for p in range(num_products):
+        products.append({
+            'id': p + 1,
+            'name': 'Product %d' % p,
+            'components': [{'id': p * num_components + c + 1,
+                            'name': 'Component %d' % c}
+                           for c in range(num_components)],
+        })
+    bugs = []
+    for i in range(num_bugs):
+        product = rand.choice(products)
+        created = start + timedelta(minutes=rand.randint(0, 60 * 24 * 365))
+        changed = created
+        history = []
+        for h in range(rand.randint(0, history_length * 2)):
+            changed += timedelta(minutes=rand.randint(1, 60 * 24 * 3))
+            if rand.random() < 0.3:
+                change = {'field_name': 'status_whiteboard', 'removed': '',
+                          'added': 'u=dev p=%d' % rand.randint(0, 13)}
+            else:
+                change = {'field_name': 'bug_status', 'removed': 'NEW',
+                          'added': rand.choice(STATUSES)}
+            history.append({'when': changed, 'who': 'dev@example.com',
+                            'changes': [change]})
+        status = rand.choice(STATUSES)
+        attachments = []
+        for a in range(rand.randint(0, 3)):
+            attachments.append({
+                'id': i * 10 + a,
+                'file_name': 'patch-%d.diff' % a,
+                'is_patch': 1,
+                'is_obsolete': rand.randint(0, 1),
+                'flags': [{'name': 'review', 'status': rand.choice('?+-'),
+                           'setter': 'dev@example.com'}],
+            })
+        bugs.append({
+            'id': 100000 + i,
+            'status': status,
+            'resolution': 'FIXED' if status in ('RESOLVED', 'VERIFIED')
+                          else '',
+            'summary': 'Synthetic bug number %d' % i,
+            'whiteboard': '[u=dev c=comp%d p=%d]' % (rand.randint(0, 5),
+                                                   rand.randint(0, 13)),
+            'assigned_to': 'dev%d@example.com' % rand.randint(0, 20),
+            'priority': rand.choice(['P1', 'P2', 'P3', '--']),
+            'severity': 'normal',
+            'product': product['name'],
+            'component': rand.choice(product['components'])['name'],
+            'blocks': [],
+            'depends_on': [100000 + rand.randint(0, num_bugs - 1)]
+                          if rand.random() < 0.2 else [],
+            'creation_time': created,
+            'last_change_time': changed,
+            'target_milestone': '---',
+            'flags': [],
+            'history': history,
+            'comments_count': rand.randint(0, 50),
+            'attachments': attachments,
+        })
+    return {'bugs': bugs, 'products': products}
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return value if isinstance(value, (list, tuple)) else [value]
+
+
+def _as_datetime(value):
+    if isinstance(value, xmlrpclib.DateTime):
+        return datetime.strptime(value.value, '%Y%m%dT%H:%M:%S')
+    if isinstance(value, basestring) and JSON_DATETIME_RE.match(value):
+        # from a JSON-RPC request.
+        return datetime.strptime(value, JSON_DATETIME_FORMAT)
+    return value
+
+
+class FakeBugzilla(object):
+    """
+    The XML-RPC methods of a Bugzilla serving `corpus`.
+
+    :param latency: seconds added to every call.
+    :param fault_rate: chance that a bug is reported as unauthorized
+                       (faultCode 102).
+    :param timeout_rate: chance that a call takes `timeout` seconds.
+    """
+    bug_sub_resources = ('history', 'comments_count', 'attachments')
+
+    def __init__(self, corpus, latency=0, fault_rate=0, timeout_rate=0,
+                 timeout=300, seed=0):
+        self.bugs = dict((bug['id'], bug) for bug in corpus['bugs'])
+        self.products = corpus.get('products') or self._products_from_bugs()
+        self.latency = latency
+        self.fault_rate = fault_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.unauthorized = set(bid for bid in sorted(self.bugs)
+                                if self.random.random() < fault_rate)
+        self.calls = []
+
+    def _products_from_bugs(self):
+        products = {}
+        for bug in self.bugs.values():
+            products.setdefault(bug['product'], set()).add(bug['component'])
+        return [{'id': i + 1, 'name': name,
+                 'components': [{'name': comp} for comp in sorted(comps)]}
+                for i, (name, comps) in enumerate(sorted(products.items()))]
+
+    def _dispatch(self, method, params):
+        func = getattr(self, method.replace('.', '_'), None)
+        if func is None:
+            raise xmlrpclib.Fault(32601, 'Unknown method %s' % method)
+        self.calls.append(method)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.timeout_rate and self.random.random() < self.timeout_rate:
+            log.debug('Timing out %s', method)
+            time.sleep(self.timeout)
+        return func(*params)
+
+    def _fields(self, bug, include_fields=None):
+        fields = dict((k, v) for k, v in bug.items()
+                      if k not in self.bug_sub_resources)
+        if include_fields:
+            fields = dict((k, v) for k, v in fields.items()
+                          if k in include_fields)
+        return fields
+
+    def _check_ids(self, ids):
+        for bid in ids:
+            bid = int(bid)
+            if bid not in self.bugs:
+                raise xmlrpclib.Fault(FAULT_INVALID_BUG,
+                                      'Bug #%d does not exist.' % bid)
+            if bid in self.unauthorized:
+                raise xmlrpclib.Fault(FAULT_UNAUTHORIZED,
+                                      'You are not authorized to access '
+                                      'bug #%d.' % bid)
+        return [int(bid) for bid in ids]
+
+    def Product_get(self, query):
+        return {'products': self.products}
+
+    def Bug_get(self, query):
+        bugs = []
+        faults = []
+        for bid in query['ids']:
+            try:
+                bid = self._check_ids([bid])[0]
+            except xmlrpclib.Fault as e:
+                if not query.get('permissive'):
+                    raise
+                faults.append({'id': int(bid), 'faultCode': e.faultCode,
+                               'faultString': e.faultString})
+                continue
+            bugs.append(self._fields(self.bugs[bid],
+                                     query.get('include_fields')))
+        return {'bugs': bugs, 'faults': faults}
+
+    def Bug_search(self, query):
+        products = _as_list(query.get('product'))
+        components = _as_list(query.get('component'))
+        statuses = _as_list(query.get('status'))
+        whiteboard = _as_list(query.get('whiteboard'))
+        changed_since = _as_datetime(query.get('last_change_time'))
+        bugs = []
+        for bid in sorted(self.bugs):
+            bug = self.bugs[bid]
+            if bid in self.unauthorized:
+                continue
+            if products and bug['product'] not in products:
+                continue
+            if components and bug['component'] not in components:
+                continue
+            if statuses and bug['status'] not in statuses:
+                continue
+            if whiteboard and not any(w in bug['whiteboard']
+                                      for w in whiteboard):
+                continue
+            if changed_since and bug['last_change_time'] < changed_since:
+                continue
+            bugs.append(self._fields(bug, query.get('include_fields')))
+        return {'bugs': bugs}
+
+    def Bug_history(self, query):
+        new_since = _as_datetime(query.get('new_since'))
+        bugs = []
+        for bid in self._check_ids(query['ids']):
+            history = self.bugs[bid].get('history', [])
+            if new_since:
+                history = [h for h in history if h['when'] > new_since]
+            bugs.append({'id': bid, 'history': history})
+        return {'bugs': bugs}
+
+    def Bug_comments(self, query):
+        new_since = _as_datetime(query.get('new_since'))
+        bugs = {}
+        for bid in self._check_ids(query['ids']):
+            bug = self.bugs[bid]
+            count = bug.get('comments_count', 0)
+            # spread out between the creation and the last change.
+            step = (bug['last_change_time'] - bug['creation_time']) / \
+                max(count - 1, 1)
+            comments = [{'id': bid * 1000 + i, 'count': i,
+                         'time': bug['creation_time'] + step * i}
+                        for i in range(count)]
+            if new_since:
+                comments = [c for c in comments if c['time'] > new_since]
+            bugs[str(bid)] = {'comments': comments}
+        return {'bugs': bugs}
+
+    def Bug_attachments(self, query):
+        return {'bugs': dict((str(bid),
+                              self.bugs[bid].get('attachments', []))
+                             for bid in self._check_ids(query['ids']))}
+
+
+class FakeBugzillaRequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc.cgi', '/jsonrpc.cgi')
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path != '/jsonrpc.cgi':
+            return SimpleXMLRPCRequestHandler.do_POST(self)
+        request = json.loads(self.rfile.read(
+            int(self.headers['content-length'])))
+        response = {'id': request.get('id'), 'result': None, 'error': None}
+        try:
+            response['result'] = self.server._dispatch(request['method'],
+                                                       request['params'])
+        except xmlrpclib.Fault as e:
+            response['error'] = {'code': e.faultCode,
+                                 'message': e.faultString}
+        body = json.dumps(response, cls=JSONRPCEncoder)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeBugzillaServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self, fake, host='127.0.0.1', port=0, log_requests=False):
+        SimpleXMLRPCServer.__init__(self, (host, port),
+                                    FakeBugzillaRequestHandler,
+                                    allow_none=True,
+                                    logRequests=log_requests)
+        self.register_instance(fake)
+        self.register_multicall_functions()
+        self.fake = fake
+
+    @property
+    def url(self):
+        return 'http://%s:%d/xmlrpc.cgi' % self.server_address
+
+    @property
+    def jsonrpc_url(self):
+        return 'http://%s:%d/jsonrpc.cgi' % self.server_address
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import Counter
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from celery import current_app
+from south.management.commands import patch_for_test_db_setup
+
+from bugzilla.api import get_bugzilla_api
+from bugzilla.fake import FakeBugzillaServer
+from bugzilla.ratelimit import AdaptiveRateLimiter
+from bugzilla.management.commands.fake_bugzilla import (fake_bugzilla_options,
+                                                        get_fake_bugzilla)
+
+
+class Command(BaseCommand):
+    help = ('Time syncing every product from a fake Bugzilla into a '
+            'throwaway test database')
+    option_list = BaseCommand.option_list + fake_bugzilla_options + (
+        make_option('--protocol', default='xmlrpc',
+                    help='xmlrpc or jsonrpc (default: xmlrpc)'),
+        make_option('--max-rate', type='int', default=0,
+                    help='Rate limit in calls per second (default: none)'),
+        make_option('--socket-timeout', type='float', default=5,
+                    help='Seconds before a call times out (default: 5)'),
+        make_option('--passes', type='int', default=2,
+                    help='Number of syncs to run; passes after the first '
+                         'only find unchanged bugs (default: 2)'),
+    )
+
+    def handle(self, *args, **options):
+        # imported here so the fake api can be swapped in below.
+        from scrum import models as scrum_models
+        from scrum import tasks as scrum_tasks
+
+        fake = get_fake_bugzilla(options)
+        server = FakeBugzillaServer(fake)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        rate_limiter = None
+        if options['max_rate']:
+            rate_limiter = AdaptiveRateLimiter(options['max_rate'])
+        url = server.url
+        if options['protocol'] == 'jsonrpc':
+            url = server.jsonrpc_url
+        bugzilla = get_bugzilla_api(options['protocol'], url=url,
+                                    rate_limiter=rate_limiter,
+                                    socket_timeout=options['socket_timeout'])
+        old_bugzilla = scrum_tasks.bugzilla
+        scrum_models.bugzilla = scrum_tasks.bugzilla = bugzilla
+        current_app.conf.CELERY_ALWAYS_EAGER = True
+        old_db_name = connection.settings_dict['NAME']
+        patch_for_test_db_setup()
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            products = bugzilla.get_products_simplified()
+            for i in range(options['passes']):
+                fake.calls = []
+                failed = 0
+                start = time.time()
+                for product in products:
+                    try:
+                        scrum_tasks.update_product(product)
+                    except Exception as e:
+                        # out of retries, e.g. with --timeout-rate.
+                        self.stderr.write('Syncing %s failed: %r\n' % (
+                            product, e))
+                        failed += 1
+                elapsed = time.time() - start
+                num_bugs = scrum_models.Bug.objects.count()
+                self.stdout.write('Pass %d: %.2fs, %d bugs in the db, '
+                                  '%.1f bugs/s, %d products failed\n' % (
+                                      i + 1, elapsed, num_bugs,
+                                      num_bugs / elapsed, failed))
+                for method, num in sorted(Counter(fake.calls).items()):
+                    self.stdout.write('    %-20s %d\n' % (method, num))
+        finally:
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
+            scrum_models.bugzilla = scrum_tasks.bugzilla = old_bugzilla
+            bugzilla('close')()
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,43 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from bugzilla.stats import BUCKET_LABELS, get_totals, reset_totals
+
+
+class Command(BaseCommand):
+    help = 'Show the Bugzilla API call stats collected by the celery tasks'
+    option_list = BaseCommand.option_list + (
+        make_option('--reset', action='store_true', default=False,
+                    help='Clear the stats after showing them'),
+    )
+
+    def handle(self, *args, **options):
+        totals = get_totals()
+        if not totals:
+            self.stdout.write('No Bugzilla calls recorded.\n')
+            return
+        row = '%-20s %7s %9s %9s %11s %11s  %s\n'
+        self.stdout.write(row % ('method', 'calls', 'avg ms', 'parse ms',
+                                 'avg kB out', 'avg kB in', 'faults'))
+        for method in sorted(totals):
+            stats = totals[method]
+            calls = stats.get('calls', 0) or 1
+            faults = ', '.join('%s: %d' % (k[len('fault_'):], v)
+                               for k, v in sorted(stats.items())
+                               if k.startswith('fault_'))
+            self.stdout.write(row % (
+                method,
+                stats.get('calls', 0),
+                stats.get('time_ms', 0) / calls,
+                stats.get('parse_ms', 0) / calls,
+                '%.1f' % (stats.get('bytes_sent', 0) / 1024.0 / calls),
+                '%.1f' % (stats.get('bytes_received', 0) / 1024.0 / calls),
+                faults or '-',
+            ))
+            histogram = ' '.join('%s=%d' % (label, stats[label])
+                                 for label in BUCKET_LABELS
+                                 if stats.get(label))
+            self.stdout.write('    seconds: %s\n' % histogram)
+        if options['reset']:
+            reset_totals()
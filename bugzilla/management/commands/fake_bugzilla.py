@@ -0,0 +1,49 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from bugzilla.fake import (FakeBugzilla, FakeBugzillaServer, load_corpus,
+                           synthetic_corpus)
+
+
+fake_bugzilla_options = (
+    make_option('--corpus', help='JSON file of recorded bugs to serve'),
+    make_option('--bugs', type='int', default=1000,
+                help='Number of synthetic bugs to serve (default: 1000)'),
+    make_option('--latency', type='float', default=0,
+                help='Seconds added to every call'),
+    make_option('--fault-rate', type='float', default=0,
+                help='Fraction of the bugs that fault with code 102'),
+    make_option('--timeout-rate', type='float', default=0,
+                help='Fraction of the calls that never return in time'),
+)
+
+
+def get_fake_bugzilla(options):
+    if options['corpus']:
+        corpus = load_corpus(options['corpus'])
+    else:
+        corpus = synthetic_corpus(options['bugs'])
+    return FakeBugzilla(corpus, latency=options['latency'],
+                        fault_rate=options['fault_rate'],
+                        timeout_rate=options['timeout_rate'])
+
+
+class Command(BaseCommand):
+    help = ('Serve a fake Bugzilla XML-RPC and JSON-RPC API for development '
+            'and benchmarks')
+    option_list = BaseCommand.option_list + fake_bugzilla_options + (
+        make_option('--port', type='int', default=8099,
+                    help='Port to listen on (default: 8099)'),
+    )
+
+    def handle(self, *args, **options):
+        fake = get_fake_bugzilla(options)
+        server = FakeBugzillaServer(fake, port=options['port'],
+                                    log_requests=True)
+        self.stdout.write('Serving %d bugs at %s and %s\n' % (
+            len(fake.bugs), server.url, server.jsonrpc_url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bugzilla.api import JSONRPCEncoder, bugzilla
+
+
+class Command(BaseCommand):
+    args = '<outfile> <product> [<product> ...]'
+    help = ('Record the scrum bugs of products from Bugzilla as a corpus '
+            'for the fake_bugzilla command')
+
+    def handle(self, *args, **options):
+        if len(args) < 2:
+            raise CommandError('An output file and a product are required.')
+        outfile, products = args[0], list(args[1:])
+        data = bugzilla.get_bugs(product=products)
+        corpus = {
+            'bugs': data['bugs'],
+            'products': [p for p in bugzilla.get_products()
+                         if p['name'] in products],
+        }
+        with open(outfile, 'w') as fh:
+            json.dump(corpus, fh, cls=JSONRPCEncoder, indent=1)
+        self.stdout.write('Recorded %d bugs to %s\n' % (len(corpus['bugs']),
+                                                       outfile))
@@ -0,0 +1,92 @@
+"""
+Rate limiting of the calls to Bugzilla, shared by all of the processes
+using the same cache.
+
+The calls per second are limited with a counter per one second window
+that every process increments atomically, so the bucket of tokens is
+refilled every second. The rate itself adapts: it's halved when Bugzilla
+times out, errors or is slow, and increased by one per second while the
+calls are healthy, up to the configured maximum.
+"""
+import logging
+import random
+import time
+
+from django.core.cache import cache
+
+
+log = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter(object):
+    """
+    :param max_rate: the most calls per second allowed.
+    :param min_rate: the rate never drops below this.
+    :param slow_seconds: calls taking longer count as failures.
+    """
+    cache_prefix = 'bugzilla:ratelimit:'
+
+    def __init__(self, max_rate, min_rate=1, slow_seconds=10):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.slow_seconds = slow_seconds
+        self.rate_key = self.cache_prefix + 'rate'
+
+    @property
+    def rate(self):
+        return cache.get(self.rate_key) or self.max_rate
+
+    def _set_rate(self, rate):
+        # forget the backoff after a quiet hour.
+        cache.set(self.rate_key, rate, 60 * 60)
+
+    def acquire(self):
+        """
+        Wait for a token.
+        """
+        while True:
+            now = time.time()
+            window = int(now)
+            key = '%swindow:%d' % (self.cache_prefix, window)
+            cache.add(key, 0, 5)
+            try:
+                calls = cache.incr(key)
+            except ValueError:
+                # expired between the add and the incr.
+                continue
+            if calls <= self.rate:
+                return
+            # jitter so that the waiting processes don't stampede.
+            time.sleep(window + 1 - now + random.random() * 0.1)
+
+    def success(self, seconds):
+        """
+        Record a finished call that took `seconds`.
+        """
+        if seconds > self.slow_seconds:
+            self.failure()
+            return
+        rate = self.rate
+        # at most one increase per second across all processes.
+        if rate < self.max_rate and cache.add(self.cache_prefix + 'ramp',
+                                              1, 1):
+            self._set_rate(rate + 1)
+
+    def failure(self):
+        """
+        Record a call that timed out or errored in a way that suggests
+        Bugzilla is overloaded.
+        """
+        rate = self.rate
+        # concurrent failures only count as one.
+        if rate > self.min_rate and cache.add(self.cache_prefix + 'backoff',
+                                              1, 1):
+            rate = max(self.min_rate, rate // 2)
+            log.warning('Bugzilla calls failing; backing off to %d/s', rate)
+            self._set_rate(rate)
+
+    def concurrency(self, max_workers):
+        """
+        Return how many calls to make in parallel, scaled by the rate.
+        """
+        return max(1, max_workers * self.rate // self.max_rate)
@@ -0,0 +1,200 @@
+"""
+Per-method metrics for the calls made to the Bugzilla API.
+
+Calls are recorded in memory by the transports, separately for each task
+(or thread) so that tasks running at the same time in threads or gevent
+greenlets don't mix their counters. At the end of each celery task
+the metrics for the task are logged and added to the totals in the cache,
+which the `bugzilla_stats` management command reports.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from celery.signals import task_postrun, task_prerun
+
+
+log = logging.getLogger(__name__)
+CACHE_PREFIX = 'bugzilla:stats:'
+# the (method, counter) names of the totals are kept in numbered slots,
+# so that processes can add names without rewriting a shared list.
+NAMES_COUNT_KEY = CACHE_PREFIX + 'names'
+NAME_SLOT_KEY = CACHE_PREFIX + 'names:%d'
+NAME_ADDED_KEY = CACHE_PREFIX + 'named:%s:%s'
+CACHE_TIMEOUT = 60 * 60 * 24 * 30  # the longest memcached allows.
+# upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def latency_bucket(seconds):
+    """Return the label of the histogram bucket for a call duration."""
+    for bound in LATENCY_BUCKETS:
+        if seconds <= bound:
+            return 'le_%s' % bound
+    return 'gt_%s' % LATENCY_BUCKETS[-1]
+
+
+BUCKET_LABELS = [latency_bucket(b) for b in LATENCY_BUCKETS] + \
+                [latency_bucket(LATENCY_BUCKETS[-1] + 1)]
+
+
+class APIStats(object):
+    """
+    Thread safe counters of calls, times, sizes and faults per method.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.methods = defaultdict(lambda: defaultdict(int))
+            self.started = time.time()
+
+    def record(self, method, seconds, bytes_sent=0, bytes_received=0,
+               parse_seconds=0, fault_code=None):
+        with self._lock:
+            stats = self.methods[method]
+            stats['calls'] += 1
+            stats['bytes_sent'] += bytes_sent
+            stats['bytes_received'] += bytes_received
+            stats['time_ms'] += int(seconds * 1000)
+            stats['parse_ms'] += int(parse_seconds * 1000)
+            stats[latency_bucket(seconds)] += 1
+            if fault_code is not None:
+                stats['fault_%s' % fault_code] += 1
+
+    def record_faults(self, method, faults):
+        """
+        Count the faults Bugzilla returns in place of some of the bugs
+        (e.g. from a permissive Bug.get).
+        """
+        with self._lock:
+            for fault in faults:
+                self.methods[method]['fault_%s' % fault['faultCode']] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict((m, dict(s)) for m, s in self.methods.items())
+
+    def summary(self):
+        """Return a one line summary of the calls, slowest method first."""
+        stats = self.snapshot()
+        parts = []
+        for method in sorted(stats, key=lambda m: -stats[m]['time_ms']):
+            s = stats[method]
+            faults = sum(v for k, v in s.items() if k.startswith('fault_'))
+            parts.append('%s: %d calls %.2fs (parse %.2fs) %dkB%s' % (
+                method, s['calls'], s['time_ms'] / 1000.0,
+                s['parse_ms'] / 1000.0, s['bytes_received'] / 1024,
+                ' %d faults' % faults if faults else ''))
+        return '; '.join(parts)
+
+    def flush_to_cache(self):
+        """
+        Add the counters to the totals in the cache and reset them.
+        """
+        stats = self.snapshot()
+        self.reset()
+        for method, counters in stats.items():
+            for name, value in counters.items():
+                _add_name(method, name)
+                if value:
+                    _incr(_total_key(method, name), value)
+
+
+def _total_key(method, name):
+    return '%s%s:%s' % (CACHE_PREFIX, method, name)
+
+
+def _incr(key, value=1):
+    # add is a no-op if the key exists, incr is atomic.
+    cache.add(key, 0, CACHE_TIMEOUT)
+    try:
+        return cache.incr(key, value)
+    except ValueError:
+        # expired between the add and the incr.
+        cache.add(key, 0, CACHE_TIMEOUT)
+        return cache.incr(key, value)
+
+
+def _add_name(method, name):
+    """
+    Add a (method, counter) name to the totals, if it's not there yet.
+    """
+    if cache.add(NAME_ADDED_KEY % (method, name), True, CACHE_TIMEOUT):
+        slot = _incr(NAMES_COUNT_KEY)
+        cache.set(NAME_SLOT_KEY % slot, (method, name), CACHE_TIMEOUT)
+
+
+def _get_names():
+    """
+    Return the cache keys of the (method, counter) names of the totals.
+    """
+    count = cache.get(NAMES_COUNT_KEY) or 0
+    return [NAME_SLOT_KEY % slot for slot in range(1, count + 1)]
+
+
+def get_totals():
+    """
+    Return the totals in the cache as {method: {counter: value}}.
+    """
+    names = cache.get_many(_get_names()).values()
+    values = cache.get_many([_total_key(method, name)
+                             for method, name in names])
+    totals = {}
+    for method, name in names:
+        totals.setdefault(method, {})[name] = values.get(
+            _total_key(method, name), 0)
+    return totals
+
+
+def reset_totals():
+    slot_keys = _get_names()
+    keys = [NAMES_COUNT_KEY] + slot_keys
+    for method, name in cache.get_many(slot_keys).values():
+        keys.extend([_total_key(method, name),
+                     NAME_ADDED_KEY % (method, name)])
+    cache.delete_many(keys)
+
+
+class LocalAPIStats(threading.local):
+    """
+    The `APIStats` of the task running in the current thread (or gevent
+    greenlet, with gevent's patched threading.local).
+
+    Threads working for a task record in the task's stats by setting
+    `stats` to those of the thread that started them.
+    """
+
+    def __init__(self):
+        self.stats = APIStats()
+        # eager tasks run inside of other tasks; only the outermost one
+        # counts.
+        self.task_depth = 0
+
+    def __getattr__(self, name):
+        return getattr(self.stats, name)
+
+
+api_stats = LocalAPIStats()
+
+
+@task_prerun.connect
+def reset_task_stats(**kwargs):
+    api_stats.task_depth += 1
+    if api_stats.task_depth == 1:
+        api_stats.stats = APIStats()
+
+
+@task_postrun.connect
+def log_task_stats(task=None, **kwargs):
+    api_stats.task_depth = max(api_stats.task_depth - 1, 0)
+    if api_stats.task_depth == 0 and api_stats.methods:
+        log.info('Bugzilla calls for %s in %.2fs: %s', task.name,
+                 time.time() - api_stats.started, api_stats.summary())
+        api_stats.flush_to_cache()
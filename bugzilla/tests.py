@@ -1 +1,492 @@
-# TODO write tests!
+import json
+import os
+import Queue
+import socket
+import threading
+import xmlrpclib
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from mock import Mock, patch
+from nose.tools import eq_, ok_
+
+from bugzilla.api import (BugzillaAPI, JSONRPCTransport, PooledTransport,
+                          ProductIndex, TransportPool)
+from bugzilla.fake import (FakeBugzilla, FakeBugzillaServer, load_corpus,
+                           synthetic_corpus)
+from bugzilla.ratelimit import AdaptiveRateLimiter
+from bugzilla.stats import (api_stats, get_totals, reset_task_stats,
+                            reset_totals)
+
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                         'scrum', 'test_data', 'bugzilla_data.json')
+PRODUCTS = [
+    {'name': 'Websites', 'components': [{'name': 'Scrumbugs'},
+                                        {'name': 'Input'}]},
+    {'name': 'Input', 'components': [{'name': 'General'},
+                                     {'name': 'Search Results'}]},
+]
+
+
+# fresh history each call; clean_bug_data changes it in place.
+@patch.object(BugzillaAPI, 'get_history',
+              Mock(side_effect=lambda *args, **kwargs:
+                   {1: [{'when': datetime(2012, 8, 10)}]}))
+@patch.object(BugzillaAPI, 'get_comments',
+              Mock(return_value={1: {'comments': [{'id': 5}]}}))
+@patch.object(BugzillaAPI, 'get_attachments',
+              Mock(return_value={2: [{'id': 10}]}))
+class TestGetBugs(TestCase):
+    def setUp(self):
+        self.bz = BugzillaAPI('https://example.com/xmlrpc.cgi')
+        self.bz.Bug = Mock()
+        self.bz.Bug.get.return_value = {'bugs': [{'id': 1}, {'id': 2}],
+                                        'faults': []}
+
+    def test_sub_resources_merged_per_bug(self):
+        """History, comments and attachments should end up on their bugs."""
+        bugs = self.bz.get_bugs(ids=[1, 2])['bugs']
+        eq_(len(bugs[0]['history']), 1)
+        eq_(bugs[0]['comments_count'], 1)
+        eq_(bugs[0]['attachments'], [])
+        eq_(bugs[1]['history'], [])
+        eq_(bugs[1]['comments_count'], 0)
+        eq_(bugs[1]['attachments'], [{'id': 10}])
+
+    def test_history_since(self):
+        """Only the new history should be fetched, as `new_history`."""
+        since = datetime(2012, 8, 1)
+        with patch.object(BugzillaAPI, 'get_history') as get_history:
+            get_history.return_value = {1: [{'when': datetime(2012, 8, 10)}]}
+            bugs = self.bz.get_bugs(ids=[1, 2], history_since=since)['bugs']
+        get_history.assert_called_with([1, 2], new_since=since)
+        eq_(len(bugs[0]['new_history']), 1)
+        ok_('history' not in bugs[0])
+        eq_(self.bz._history_query([1], since),
+            {'ids': [1], 'new_since': since})
+
+    def test_comments_since(self):
+        """Only the new comments should be fetched, as `new_comments`."""
+        since = datetime(2012, 8, 1)
+        with patch.object(BugzillaAPI, 'get_comments') as get_comments:
+            get_comments.return_value = {1: {'comments': [
+                {'id': 5, 'time': datetime(2012, 8, 10), 'count': 3}]}}
+            bugs = self.bz.get_bugs(ids=[1, 2], comments_since=since)['bugs']
+        get_comments.assert_called_with([1, 2], new_since=since)
+        eq_(bugs[0]['new_comments'][0]['count'], 3)
+        ok_('comments_count' not in bugs[0])
+        eq_(self.bz._comments_query([1], since)['include_fields'],
+            ['id', 'time', 'count'])
+
+    def test_skipped_sub_resources_not_fetched(self):
+        """Only the requested sub-resources should be fetched."""
+        results = self.bz._fetch_concurrently([1, 2], ['get_history'])
+        eq_(results.keys(), ['get_history'])
+        eq_(self.bz._fetch_concurrently([1, 2], []), {})
+
+
+class TestProductIndex(TestCase):
+    def setUp(self):
+        self.index = ProductIndex(PRODUCTS)
+
+    def test_prefix_matches_first(self):
+        """Names starting with the query should rank first."""
+        eq_(self.index.search('inp'), [
+            'Input :: __ALL__',
+            'Input :: General',
+            'Input :: Search Results',
+            'Websites :: Input',
+        ])
+        eq_(self.index.search('web scrum'), ['Websites :: Scrumbugs'])
+        eq_(self.index.search('res'), ['Input :: Search Results'])
+
+    def test_substring_matches(self):
+        """Words containing the query should match after the prefixes."""
+        eq_(self.index.search('bugs'), ['Websites :: Scrumbugs'])
+        eq_(self.index.search('put', limit=2),
+            ['Input :: __ALL__', 'Input :: General'])
+        eq_(self.index.search(' :: '), [])
+
+    @patch.object(BugzillaAPI, 'get_products', Mock(return_value=PRODUCTS))
+    def test_search_view(self):
+        """The view should return the matches in select2's format."""
+        url = reverse('bugzilla_products_search')
+        resp = self.client.get(url, {'q': 'scrum'})
+        eq_(json.loads(resp.content), {'results': [
+            {'id': 'Websites :: Scrumbugs', 'text': 'Websites :: Scrumbugs'},
+        ]})
+        resp = self.client.get(url, {'q': 'i', 'limit': 1})
+        eq_(len(json.loads(resp.content)['results']), 1)
+        # at least one, however small the limit.
+        for limit in (0, -5):
+            resp = self.client.get(url, {'q': 'i', 'limit': limit})
+            eq_(len(json.loads(resp.content)['results']), 1)
+
+
+class TestMulticall(TestCase):
+    def setUp(self):
+        self.bz = BugzillaAPI('https://example.com/xmlrpc.cgi',
+                              multicall=True)
+        self.bz.Bug = Mock()
+        self.bz.system = Mock()
+        self.bz.system.multicall.return_value = [
+            [{'bugs': [{'id': 1}], 'faults': []}],
+            [{'bugs': [{'id': 1, 'history': [{'when': datetime(2012, 8, 10),
+                                              'changes': []}]}]}],
+            {'faultCode': 100, 'faultString': 'Oops'},
+            [{'bugs': {'1': [{'id': 10}]}}],
+        ]
+
+    def test_single_request(self):
+        """All of the calls should go out in one request."""
+        bugs = self.bz.get_bugs(ids=[1])['bugs']
+        eq_(self.bz.system.multicall.call_count, 1)
+        calls = self.bz.system.multicall.call_args[0][0]
+        eq_([c['methodName'] for c in calls],
+            ['Bug.get', 'Bug.history', 'Bug.comments', 'Bug.attachments'])
+        ok_(not self.bz.Bug.get.called)
+        eq_(len(bugs[0]['history']), 1)
+        # a fault for one call only loses that data.
+        eq_(bugs[0]['comments_count'], 0)
+        eq_(bugs[0]['attachments'], [{'id': 10}])
+
+    def test_fallback_without_multicall(self):
+        """Servers without multicall should get single calls."""
+        self.bz.system.multicall.side_effect = xmlrpclib.Fault(
+            1, 'method "system.multicall" is not supported')
+        self.bz.Bug.get.return_value = {'bugs': [], 'faults': []}
+        self.bz.get_bugs(ids=[1])
+        ok_(self.bz.Bug.get.called)
+        ok_(not self.bz.use_multicall)
+        self.bz.get_bugs(ids=[1])
+        eq_(self.bz.system.multicall.call_count, 1)
+
+
+class TestTransportPool(TestCase):
+    def setUp(self):
+        self.pool = TransportPool(transport_class=Mock, size=2, timeout=0)
+
+    def test_checkouts_are_exclusive(self):
+        """Concurrent checkouts should never share a transport."""
+        t1 = self.pool.get()
+        t2 = self.pool.get()
+        ok_(t1 is not t2)
+        with self.assertRaises(Queue.Empty):
+            self.pool.get()
+
+    def test_transports_are_reused(self):
+        """A returned transport (and its connection) should be reused."""
+        with self.pool.transport() as t1:
+            pass
+        with self.pool.transport() as t2:
+            pass
+        ok_(t1 is t2)
+        ok_(not t1.close.called)
+
+    def test_transport_closed_on_error(self):
+        """A transport that errored should have its connection closed."""
+        with self.assertRaises(IOError):
+            with self.pool.transport() as t1:
+                raise IOError
+        ok_(t1.close.called)
+        eq_(self.pool._pool.qsize(), 2)
+
+    @patch('bugzilla.api.os.getpid')
+    def test_pool_reset_after_fork(self, getpid):
+        """A forked process should not use its parent's connections."""
+        getpid.return_value = 1
+        self.pool._reset()
+        with self.pool.transport() as t1:
+            pass
+        getpid.return_value = 2
+        with self.pool.transport() as t2:
+            pass
+        ok_(t1 is not t2)
+
+
+class TestRateLimiter(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.limiter = AdaptiveRateLimiter(8, min_rate=2)
+
+    @patch('bugzilla.ratelimit.time')
+    def test_acquire_waits_for_next_second(self, time_mock):
+        """Calls over the rate should wait for the next window."""
+        time_mock.time.side_effect = [100.0, 100.1, 100.2, 101.0]
+        self.limiter.max_rate = 2
+        for i in range(3):
+            self.limiter.acquire()
+        eq_(time_mock.sleep.call_count, 1)
+        ok_(0.8 <= time_mock.sleep.call_args[0][0] < 1)
+
+    def test_aimd(self):
+        """Failures should halve the rate and healthy calls ramp it up."""
+        self.limiter.failure()
+        eq_(self.limiter.rate, 4)
+        # concurrent failures back off only once.
+        self.limiter.failure()
+        eq_(self.limiter.rate, 4)
+        eq_(self.limiter.concurrency(4), 2)
+        self.limiter.success(1)
+        eq_(self.limiter.rate, 5)
+        # slow calls count as failures.
+        cache.delete(self.limiter.cache_prefix + 'backoff')
+        self.limiter.success(60)
+        eq_(self.limiter.rate, 2)
+
+    def test_transport_reports_overload(self):
+        """Timeouts and 503s should back off, but not Bugzilla faults."""
+        transport = Mock()
+        limiter = Mock()
+        pooled = PooledTransport(lambda **kw: transport, size=1,
+                                 rate_limiter=limiter)
+        for error in (socket.timeout(), xmlrpclib.ProtocolError(
+                'bz', 503, 'Service Unavailable', {})):
+            transport.request.side_effect = error
+            with self.assertRaises(error.__class__):
+                pooled.request('bz', '/xmlrpc.cgi', '')
+        eq_(limiter.failure.call_count, 2)
+        transport.request.side_effect = xmlrpclib.Fault(102, 'Nope')
+        with self.assertRaises(xmlrpclib.Fault):
+            pooled.request('bz', '/xmlrpc.cgi', '')
+        eq_(limiter.failure.call_count, 2)
+        transport.request.side_effect = None
+        pooled.request('bz', '/xmlrpc.cgi', '')
+        eq_(limiter.acquire.call_count, 4)
+        eq_(limiter.success.call_count, 1)
+
+    def test_timeout_backs_off(self):
+        """Calls to a stalled Bugzilla should time out and back off."""
+        fake = FakeBugzilla(load_corpus(TEST_DATA), timeout_rate=1,
+                            timeout=1)
+        server = FakeBugzillaServer(fake)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        transport = PooledTransport(use_datetime=True, secure=False,
+                                    socket_timeout=0.1,
+                                    rate_limiter=self.limiter)
+        bz = BugzillaAPI(server.url, transport=transport, allow_none=True)
+        try:
+            with self.assertRaises(socket.timeout):
+                bz.Bug.get({'ids': [778465]})
+        finally:
+            transport.close()
+            server.shutdown()
+            server.server_close()
+        eq_(self.limiter.rate, 4)
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class JSONRPCHandler(BaseHTTPRequestHandler):
+    """Bugzilla JSON-RPC stand-in that knows Bug.get and Bug.history."""
+    protocol_version = 'HTTP/1.1'
+    results = {
+        'Bug.get': {
+            'bugs': [{'id': 1, 'last_change_time': '2012-08-31T00:56:45Z',
+                      'summary': '2012-08-31T00:56:45Z is a date'}],
+            'faults': [{'id': 2, 'faultCode': 102,
+                        'faultString': 'Not authorized'}],
+        },
+        'Bug.history': {
+            'bugs': [{'id': 1, 'history': [{
+                'when': '2012-08-10T14:14:26Z',
+                'changes': [{'field_name': 'cf_due_date',
+                             'removed': '',
+                             'added': '2012-09-01T00:00:00Z'}],
+            }]}],
+        },
+    }
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(
+            int(self.headers['content-length'])))
+        self.server.requests.append(request)
+        response = {'id': request['id'], 'result': None, 'error': None}
+        if request['method'] in self.results:
+            response['result'] = self.results[request['method']]
+        else:
+            response['error'] = {'code': 32000, 'message': 'Unknown method'}
+        body = json.dumps(response)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestJSONRPC(TestCase):
+    def setUp(self):
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), JSONRPCHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:%d/jsonrpc.cgi' % self.server.server_port
+        self.transport = JSONRPCTransport(use_datetime=True, secure=False)
+        self.bz = BugzillaAPI(url, transport=self.transport, allow_none=True)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_bugs(self):
+        """Bugs should come back just like they do over XML-RPC."""
+        bugs = self.bz.get_bugs(ids=[1, 2], comments=False,
+                                attachments=False)
+        eq_(self.server.requests[0]['method'], 'Bug.get')
+        eq_(self.server.requests[0]['params'][0]['ids'], [1, 2])
+        bug = bugs['bugs'][0]
+        eq_(bug['last_change_time'].year, 2012)
+        ok_(bug['last_change_time'].tzinfo)
+        eq_(bug['summary'], '2012-08-31T00:56:45Z is a date')
+        eq_(bug['history'][0]['when'].day, 10)
+        # only the date fields, as over XML-RPC.
+        eq_(bug['history'][0]['changes'][0]['added'], '2012-09-01T00:00:00Z')
+        eq_(bugs['faults'][0]['faultCode'], 102)
+
+    def test_errors_raise_faults(self):
+        """JSON-RPC errors should raise the usual xmlrpclib.Fault."""
+        with self.assertRaises(xmlrpclib.Fault):
+            self.bz.Product.get({'ids': [1]})
+        eq_(self.bz.get_comments([1]), {})
+
+    def test_datetime_params(self):
+        """datetime parameters should be sent as Bugzilla date strings."""
+        self.bz.Bug.get({'last_change_time': datetime(2012, 8, 10)})
+        eq_(self.server.requests[0]['params'][0]['last_change_time'],
+            '2012-08-10T00:00:00Z')
+
+
+class TestFakeBugzilla(TestCase):
+    def setUp(self):
+        self.fake = FakeBugzilla(load_corpus(TEST_DATA))
+        self.server = FakeBugzillaServer(self.fake)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.transport = PooledTransport(use_datetime=True, secure=False)
+        self.bz = BugzillaAPI(self.server.url, transport=self.transport,
+                              allow_none=True)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_bugs(self):
+        """The recorded bugs should come back with all of their data."""
+        bugs = self.bz.get_bugs(ids=[778465, 781717])['bugs']
+        eq_([bug['id'] for bug in bugs], [778465, 781717])
+        bug = self.fake.bugs[778465]
+        eq_(len(bugs[0]['history']), len(bug['history']))
+        eq_(bugs[0]['comments_count'], bug['comments_count'])
+        eq_(len(bugs[0]['attachments']),
+            len(bug.get('attachments', [])))
+        ok_(bugs[0]['last_change_time'].tzinfo)
+
+    def test_get_bugs_since(self):
+        """Only the newer history and comments should come back."""
+        bug = self.fake.bugs[778465]
+        since = bug['history'][-2]['when']
+        data = self.bz.get_bugs(ids=[778465], history_since=since,
+                                comments_since=bug['last_change_time'])
+        new_bug = data['bugs'][0]
+        eq_(len(new_bug['new_history']), 1)
+        eq_(new_bug['new_comments'], [])
+
+    def test_jsonrpc(self):
+        """The fake should serve the same bugs over JSON-RPC."""
+        transport = PooledTransport(JSONRPCTransport, use_datetime=True,
+                                    secure=False)
+        bz = BugzillaAPI(self.server.jsonrpc_url, transport=transport,
+                         allow_none=True)
+        bug = self.fake.bugs[778465]
+        since = bug['history'][-2]['when']
+        try:
+            eq_(bz.get_bugs(ids=[778465, 781717]),
+                self.bz.get_bugs(ids=[778465, 781717]))
+            data = bz.get_bugs(ids=[778465], history_since=since)
+            eq_(len(data['bugs'][0]['new_history']), 1)
+            with self.assertRaises(xmlrpclib.Fault):
+                bz.Bug.history({'ids': [1]})
+        finally:
+            transport.close()
+
+    def test_search(self):
+        """Searches should filter on product and change time."""
+        bug = self.fake.bugs[778465]
+        changed = self.bz.get_bug_change_times(
+            product=bug['product'], last_change_time=bug['last_change_time'])
+        ok_(778465 in changed)
+        ok_(all(t >= changed[778465] for t in changed.values()))
+        eq_(self.bz.get_bug_ids(product='Nope'), [])
+
+    def test_faults(self):
+        """Unauthorized bugs should fault with code 102."""
+        self.fake.unauthorized.add(778465)
+        data = self.bz.get_bugs(ids=[778465, 781717], history=False,
+                                comments=False, attachments=False)
+        eq_([bug['id'] for bug in data['bugs']], [781717])
+        eq_(data['faults'][0]['faultCode'], 102)
+        with self.assertRaises(xmlrpclib.Fault):
+            self.bz.Bug.history({'ids': [778465]})
+
+    def test_stats(self):
+        """Calls, sizes and faults should be recorded per method."""
+        api_stats.reset()
+        reset_totals()
+        self.fake.unauthorized.add(778465)
+        self.bz.get_bugs(ids=[778465, 781717], comments=False,
+                         attachments=False)
+        with self.assertRaises(xmlrpclib.Fault):
+            self.bz.Bug.history({'ids': [778465]})
+        stats = api_stats.snapshot()
+        eq_(stats['Bug.get']['calls'], 1)
+        eq_(stats['Bug.get']['fault_102'], 1)
+        ok_(stats['Bug.get']['bytes_received'] > 500)
+        ok_(stats['Bug.get']['bytes_sent'] > 0)
+        eq_(stats['Bug.history']['calls'], 2)
+        eq_(stats['Bug.history']['fault_102'], 1)
+        eq_(stats['Bug.history']['le_0.1'], 2)
+        api_stats.flush_to_cache()
+        eq_(api_stats.snapshot(), {})
+        eq_(get_totals(), stats)
+
+    def test_stats_per_thread(self):
+        """Tasks in other threads shouldn't reset or mix the stats."""
+        api_stats.reset()
+        api_stats.record('Bug.get', 0.05)
+        other_stats = []
+
+        def other_task():
+            reset_task_stats()
+            api_stats.record('Bug.history', 0.05)
+            other_stats.append(api_stats.snapshot())
+
+        thread = threading.Thread(target=other_task)
+        thread.start()
+        thread.join()
+        eq_(api_stats.snapshot().keys(), ['Bug.get'])
+        eq_(other_stats[0].keys(), ['Bug.history'])
+
+    def test_synthetic_corpus(self):
+        """The synthetic corpus should be repeatable."""
+        corpus = synthetic_corpus(20, seed=1)
+        eq_(len(corpus['bugs']), 20)
+        eq_(corpus, synthetic_corpus(20, seed=1))
+        fake = FakeBugzilla(corpus, fault_rate=1)
+        eq_(len(fake.unauthorized), 20)
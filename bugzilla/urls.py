@@ -1,8 +1,10 @@
 from django.conf.urls import patterns, url
 
-from bugzilla.views import GetAllProductsView
+from bugzilla.views import GetAllProductsView, SearchProductsView
 
 
 urlpatterns = patterns('',
     url(r'products/$', GetAllProductsView.as_view()),
+    url(r'products/search/$', SearchProductsView.as_view(),
+        name='bugzilla_products_search'),
 )
@@ -9,3 +9,24 @@ class GetAllProductsView(View):
     def get(self, request):
         products = json.dumps(bugzilla.get_products_simplified())
         return HttpResponse(products, mimetype='application/json')
+
+
+class SearchProductsView(View):
+    """
+    Autocomplete for 'Product :: Component' names in the format select2
+    expects.
+    """
+    max_limit = 100
+
+    def get(self, request):
+        query = request.GET.get('q', '')
+        try:
+            limit = max(1, min(int(request.GET.get('limit', 20)),
+                               self.max_limit))
+        except ValueError:
+            limit = 20
+        names = bugzilla.search_products(query, limit) if query else []
+        results = json.dumps({
+            'results': [{'id': name, 'text': name} for name in names],
+        })
+        return HttpResponse(results, mimetype='application/json')
@@ -9,6 +9,7 @@ from django.core.paginator import Paginator
 from cronjobs import register
 
 from scrum.models import Bug, BugzillaURL, BZProduct, Project, Sprint
+from scrum.tasks import sync_products as sync_products_task
 from scrum.tasks import update_bug_chunks
 
 
@@ -31,6 +32,12 @@ def reprocess_bugs():
     print '\nDone.'
 
 
+@register
+def sync_products():
+    """Cron version of the periodic celery task."""
+    sync_products_task()
+
+
 @register
 def clear_cache():
     cache.clear()
@@ -39,7 +46,8 @@ def clear_cache():
 @register
 def update_old_format_bugs():
     bugs = Bug.objects.filter(assigned_to__contains='||').only('id')
-    update_bug_chunks(bugs)
+    # the format changed on our end, not in Bugzilla.
+    update_bug_chunks(bugs, force=True)
 
 
 @register
@@ -0,0 +1,95 @@
+import random
+import time
+from datetime import date, timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from south.management.commands import patch_for_test_db_setup
+
+from scrum.models import Bug, BugPointsChange, Sprint, Team
+from scrum.utils import date_range, date_to_js
+
+
+def per_bug_burndown(sprint):
+    """The burndown summed one bug and one day at a time."""
+    bugs = list(sprint.get_bugs().prefetch_related('points_changes'))
+    return [[date_to_js(cdate), sum(bug.points_for_date(cdate)
+                                    for bug in bugs)]
+            for cdate in date_range(sprint.start_date, sprint.end_date)]
+
+
+def computed_burndown(sprint):
+    """The burndown worked out again rather than read from the snapshots."""
+    sprint.snapshots.all().delete()
+    return sprint.get_burndown()
+
+
+class Command(BaseCommand):
+    help = ('Time computing the burndown of a sprint of synthetic bugs in '
+            'a throwaway test database')
+    option_list = BaseCommand.option_list + (
+        make_option('--bugs', type='int', default=1000,
+                    help='Number of bugs in the sprint (default: 1000)'),
+        make_option('--days', type='int', default=30,
+                    help='Length of the sprint in days (default: 30)'),
+        make_option('--changes', type='int', default=4,
+                    help='Most points changes per bug (default: 4)'),
+        make_option('--runs', type='int', default=5,
+                    help='Times to compute each burndown (default: 5)'),
+    )
+
+    def create_sprint(self, options):
+        rand = random.Random(0)
+        start = date(2012, 1, 1)
+        team = Team.objects.create(name='Benchmark', slug='benchmark')
+        sprint = team.sprints.create(
+            name='Benchmark', slug='benchmark', start_date=start,
+            end_date=start + timedelta(days=options['days'] - 1))
+        bugs = []
+        changes = []
+        for i in range(options['bugs']):
+            points = rand.randint(0, 13)
+            bugs.append(Bug(id=100000 + i, sprint=sprint, status='NEW',
+                            whiteboard='u=dev p=%d' % points,
+                            story_points=points, has_scrum_data=True,
+                            summary='Synthetic bug number %d' % i))
+            cdate = start - timedelta(days=rand.randint(0, 10))
+            for c in range(rand.randint(0, options['changes'])):
+                cdate += timedelta(days=rand.randint(0, options['days']))
+                changes.append(BugPointsChange(bug_id=100000 + i, date=cdate,
+                                               points=rand.randint(0, 13)))
+        Bug.objects.bulk_create(bugs)
+        BugPointsChange.objects.bulk_create(changes)
+        return Sprint.objects.get(id=sprint.id)
+
+    def time_burndown(self, name, func, sprint, runs):
+        start = time.time()
+        for i in range(runs):
+            burndown = func(sprint)
+        self.stdout.write('%-12s %8.1f ms\n' % (
+            name, (time.time() - start) * 1000 / runs))
+        return burndown
+
+    def handle(self, *args, **options):
+        old_db_name = connection.settings_dict['NAME']
+        patch_for_test_db_setup()
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            sprint = self.create_sprint(options)
+            self.stdout.write('%d bugs, %d days, %d points changes\n' % (
+                options['bugs'], options['days'],
+                BugPointsChange.objects.count()))
+            runs = options['runs']
+            expected = self.time_burndown('per bug', per_bug_burndown,
+                                          sprint, runs)
+            burndowns = [self.time_burndown('computed', computed_burndown,
+                                            sprint, runs)]
+            sprint.update_snapshots(days=[])
+            burndowns.append(self.time_burndown(
+                'snapshots', Sprint.get_burndown, sprint, runs))
+            if any(burndown != expected for burndown in burndowns):
+                self.stderr.write('The burndowns differ!\n')
+        finally:
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
@@ -0,0 +1,74 @@
+import json
+import time
+import zlib
+from base64 import b64encode
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from bugzilla.fake import load_corpus, synthetic_corpus
+from scrum.models import CompressedJSONField, JSON_CODECS, decode_json_bytes
+
+
+PAYLOAD_FIELDS = ('history', 'flags', 'attachments')
+
+
+class LegacyField(CompressedJSONField):
+    """The format from before the codecs: base64 of zlib level 9."""
+
+    def encode(self, text):
+        return b64encode(zlib.compress(text, 9))
+
+
+class Command(BaseCommand):
+    help = ('Compare the encode and decode times and stored sizes of the '
+            'CompressedJSONField codecs on bug data')
+    option_list = BaseCommand.option_list + (
+        make_option('--corpus', help='JSON file of recorded bugs to use'),
+        make_option('--bugs', type='int', default=1000,
+                    help='Number of synthetic bugs to use (default: 1000)'),
+        make_option('--history-length', type='int', default=40,
+                    help='Average history entries of the synthetic bugs '
+                         '(default: 40)'),
+    )
+
+    def get_fields(self):
+        fields = [('legacy', LegacyField())]
+        for codec in sorted(JSON_CODECS):
+            levels = [1, 6, 9] if codec == 'zlib' else [None]
+            for level in levels:
+                name = codec if level is None else '%s-%d' % (codec, level)
+                fields.append((name, CompressedJSONField(codec=codec,
+                                                         level=level)))
+        return fields
+
+    def handle(self, *args, **options):
+        if options['corpus']:
+            bugs = load_corpus(options['corpus'])['bugs']
+        else:
+            bugs = synthetic_corpus(
+                options['bugs'],
+                history_length=options['history_length'] // 2)['bugs']
+        row = '%-12s %-10s %10s %10s %12s %7s\n'
+        self.stdout.write(row % ('field', 'codec', 'encode ms', 'decode ms',
+                                 'stored kB', 'ratio'))
+        for name in PAYLOAD_FIELDS:
+            values = [bug.get(name) or [] for bug in bugs]
+            json_size = None
+            for codec, field in self.get_fields():
+                start = time.time()
+                stored = [field.encode(field.get_prep_value(v))
+                          for v in values]
+                encode_time = time.time() - start
+                start = time.time()
+                for raw in stored:
+                    json.loads(decode_json_bytes(raw))
+                decode_time = time.time() - start
+                size = sum(len(raw) for raw in stored)
+                if json_size is None:
+                    json_size = sum(len(field.get_prep_value(v))
+                                    for v in values)
+                self.stdout.write(row % (
+                    name, codec, '%.1f' % (encode_time * 1000),
+                    '%.1f' % (decode_time * 1000), '%.1f' % (size / 1024.0),
+                    '%.2f' % (float(size) / json_size)))
@@ -0,0 +1,185 @@
+import random
+import time
+from datetime import timedelta
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.timezone import now
+
+from south.db import db
+from south.management.commands import patch_for_test_db_setup
+
+from bugzilla.api import BUG_CLOSED_STATUSES, BUG_OPEN_STATUSES
+from scrum.models import (Bug, BugDependency, BZProduct, Project, Sprint,
+                          Team)
+
+
+EXPLAIN = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+def get_indexes():
+    """The composite indexes of the models, as (table, columns) pairs."""
+    indexes = []
+    for model in (Bug, Sprint):
+        for fields in model._meta.index_together:
+            indexes.append((model._meta.db_table,
+                            [model._meta.get_field(name).column
+                             for name in fields]))
+    return indexes
+
+
+class Command(BaseCommand):
+    help = ('Show the query plans and times of the bug queries with and '
+            'without the composite indexes, on synthetic bugs in a '
+            'throwaway test database')
+    option_list = BaseCommand.option_list + (
+        make_option('--bugs', type='int', default=50000,
+                    help='Number of bugs (default: 50000)'),
+        make_option('--teams', type='int', default=10,
+                    help='Number of teams, each with 3 projects and 10 '
+                         'sprints (default: 10)'),
+        make_option('--runs', type='int', default=5,
+                    help='Times to run each query (default: 5)'),
+        make_option('--no-plans', action='store_false', dest='plans',
+                    default=True, help="Only show the times"),
+    )
+
+    def create_data(self, options):
+        rand = random.Random(0)
+        today = now().date()
+        products = ['Product %d' % p for p in range(20)]
+        components = ['Component %d' % c for c in range(10)]
+        projects = []
+        sprints = []
+        for t in range(options['teams']):
+            team = Team.objects.create(name='Team %d' % t, slug='team%d' % t)
+            for p in range(3):
+                project = Project.objects.create(name='Project %d-%d' % (t, p),
+                                                 slug='project%d-%d' % (t, p),
+                                                 team=team)
+                product = rand.choice(products)
+                # bulk_create so that saving them doesn't sync from Bugzilla.
+                BZProduct.objects.bulk_create([
+                    BZProduct(name=product, component=component,
+                              project=project)
+                    for component in rand.sample(components, 3)])
+                projects.append(project)
+            # two week sprints, the last of them running today.
+            for s in range(10):
+                start = today - timedelta(days=14 * (9 - s) + 7)
+                sprints.append(team.sprints.create(
+                    name='Sprint %d' % s, slug='sprint%d' % s,
+                    start_date=start, end_date=start + timedelta(days=13)))
+        bugs = []
+        for i in range(options['bugs']):
+            sprint = project = None
+            placed = rand.random()
+            if placed < 0.3:
+                sprint = rand.choice(sprints)
+                project = rand.choice([p for p in projects
+                                       if p.team_id == sprint.team_id])
+            elif placed < 0.5:
+                project = rand.choice(projects)
+            whiteboard = ''
+            if rand.random() < 0.6:
+                whiteboard = '[u=dev c=comp p=%d]' % rand.randint(0, 13)
+            blocker = 100000 + rand.randint(0, options['bugs'] - 1)
+            bugs.append(Bug(
+                id=100000 + i, sprint=sprint, project=project,
+                product=rand.choice(products),
+                component=rand.choice(components),
+                status=rand.choice(BUG_OPEN_STATUSES + BUG_CLOSED_STATUSES),
+                assigned_to='dev%d@example.com' % rand.randint(0, 50),
+                summary='Synthetic bug number %d' % i,
+                whiteboard=whiteboard, has_scrum_data=bool(whiteboard),
+                story_points=rand.randint(0, 13) if whiteboard else 0,
+                depends_on=[blocker] if rand.random() < 0.2 else [],
+                flags=[{'name': 'needinfo', 'status': '?'}]
+                      if rand.random() < 0.1 else []))
+        Bug.objects.bulk_create(bugs, batch_size=500)
+        BugDependency.objects.set_for_bugs(bugs)
+        connection.cursor().execute('ANALYZE')
+        return rand.choice(projects), rand.choice(sprints)
+
+    def get_queries(self, project, sprint):
+        """
+        Return (name, queryset, action) tuples; the plan is of the queryset
+        and the action on it is timed.
+        """
+        today = now().date()
+        team = project.team
+        products = project.get_products()
+        sprinting = Bug.objects.filter(sprint__start_date__lte=today,
+                                       sprint__end_date__gte=today,
+                                       project=project)
+        return [
+            ('by_products().open()', Bug.objects.by_products(products).open(),
+             list),
+            ('project backlog', project.get_backlog(), list),
+            ('team backlog', team.get_bugs(), list),
+            ('team get_aggregate_data', team.get_bugs(),
+             lambda bugs: bugs.get_aggregate_data()),
+            ('team get_blocked', team.get_bugs(),
+             lambda bugs: bugs.get_blocked()),
+            ('team get_flagged', team.get_bugs(),
+             lambda bugs: bugs.get_flagged()),
+            ('sprint bugs', sprint.get_bugs(), list),
+            ('running sprint bugs', sprinting, list),
+            ('running sprints', Sprint.objects.filter(
+                start_date__lte=today, end_date__gte=today), list),
+        ]
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute(EXPLAIN.get(connection.vendor, 'EXPLAIN ') + sql,
+                       params)
+        return [' '.join(unicode(col) for col in row)
+                for row in cursor.fetchall()]
+
+    def run_queries(self, label, queries, options):
+        self.stdout.write('\n%s\n%s\n' % (label, '=' * len(label)))
+        for name, queryset, action in queries:
+            start = time.time()
+            for i in range(options['runs']):
+                # a fresh copy so that nothing is cached.
+                action(queryset.all())
+            elapsed = (time.time() - start) * 1000 / options['runs']
+            self.stdout.write('%-28s %8.1f ms\n' % (name, elapsed))
+            if options['plans']:
+                for line in self.explain(queryset):
+                    self.stdout.write('    %s\n' % line)
+
+    def handle(self, *args, **options):
+        old_db_name = connection.settings_dict['NAME']
+        indexes = get_indexes()
+        # create the tables without the composite indexes, from the models
+        # rather than the migrations that add them.
+        settings.SOUTH_TESTS_MIGRATE = False
+        index_together = dict((model, model._meta.index_together)
+                              for model in (Bug, Sprint))
+        for model in index_together:
+            model._meta.index_together = []
+        patch_for_test_db_setup()
+        try:
+            connection.creation.create_test_db(verbosity=0)
+        finally:
+            for model, value in index_together.items():
+                model._meta.index_together = value
+        try:
+            project, sprint = self.create_data(options)
+            queries = self.get_queries(project, sprint)
+            self.run_queries('Without the composite indexes', queries,
+                             options)
+            for table, columns in indexes:
+                db.create_index(table, columns)
+            connection.cursor().execute('ANALYZE')
+            self.run_queries('With the composite indexes', queries, options)
+        finally:
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
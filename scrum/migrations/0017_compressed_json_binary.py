@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+from base64 import b64encode
+import zlib
+
+
+# (table, pk column, CompressedJSONField column)
+COLUMNS = [
+    (u'scrum_bug', 'id', 'history'),
+    (u'scrum_bug', 'id', 'flags'),
+    (u'scrum_bug', 'id', 'attachments'),
+    (u'scrum_bughistorychunk', 'id', 'entries'),
+]
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # The compressed JSON is stored as bytes instead of base64 text.
+        # Rows in the old format are still read, and rewritten as they change.
+        for table, pk, column in COLUMNS:
+            if db.backend_name == 'postgres':
+                # databases created after this change already have bytea.
+                data_type = db.execute(
+                    'SELECT data_type FROM information_schema.columns '
+                    'WHERE table_name = %s AND column_name = %s',
+                    [table, column])
+                if data_type and data_type[0][0] == 'bytea':
+                    continue
+                # text doesn't cast to bytea without help.
+                db.execute('ALTER TABLE %s ALTER COLUMN %s TYPE bytea '
+                           'USING convert_to(%s::text, \'UTF8\')' % (
+                               db.quote_name(table), db.quote_name(column),
+                               db.quote_name(column)))
+            else:
+                db.alter_column(table, column,
+                                self.gf('scrum.models.CompressedJSONField')(
+                                    blank=True))
+
+    def backwards(self, orm):
+        from scrum.models import decode_json_bytes
+
+        for table, pk, column in COLUMNS:
+            # back to base64 of zlib level 9 before it's text again.
+            if not db.dry_run:
+                rows = db.execute('SELECT %s, %s FROM %s' % (
+                    db.quote_name(pk), db.quote_name(column),
+                    db.quote_name(table)))
+                for row_id, raw in rows:
+                    if raw is None:
+                        continue
+                    text = decode_json_bytes(raw)
+                    db.execute('UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+                        db.quote_name(table), db.quote_name(column),
+                        db.quote_name(pk)), [
+                        b64encode(zlib.compress(text, 9)), row_id])
+            if db.backend_name == 'postgres':
+                db.execute('ALTER TABLE %s ALTER COLUMN %s TYPE text '
+                           'USING convert_from(%s, \'UTF8\')' % (
+                               db.quote_name(table), db.quote_name(column),
+                               db.quote_name(column)))
+            else:
+                db.alter_column(table, column,
+                                self.gf('django.db.models.fields.TextField')(
+                                    default='{}', blank=True))
+
+    models = {
+        u'scrum.bug': {
+            'Meta': {'ordering': "('id',)", 'object_name': 'Bug'},
+            'assigned_to': ('django.db.models.fields.CharField', [], {'max_length': '500'}),
+            'attachments': ('scrum.models.CompressedJSONField', [], {'default': '{}', 'blank': 'True'}),
+            'blocks': ('jsonfield.fields.JSONField', [], {'default': '{}', 'blank': 'True'}),
+            'comments_count': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'component': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'creation_time': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'depends_on': ('jsonfield.fields.JSONField', [], {'default': '{}', 'blank': 'True'}),
+            'flags': ('scrum.models.CompressedJSONField', [], {'default': '{}', 'blank': 'True'}),
+            'history_base': ('scrum.models.CompressedJSONField', [], {'default': '{}', 'db_column': "'history'", 'blank': 'True'}),
+            'history_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True'}),
+            'history_time': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.PositiveIntegerField', [], {'primary_key': 'True'}),
+            'last_change_time': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_synced_time': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'priority': ('django.db.models.fields.CharField', [], {'max_length': '2', 'blank': 'True'}),
+            'product': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'project': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'bugs'", 'null': 'True', 'on_delete': 'models.SET_NULL', 'to': u"orm['scrum.Project']"}),
+            'resolution': ('django.db.models.fields.CharField', [], {'max_length': '20', 'blank': 'True'}),
+            'severity': ('django.db.models.fields.CharField', [], {'max_length': '20', 'blank': 'True'}),
+            'sprint': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'bugs'", 'null': 'True', 'on_delete': 'models.SET_NULL', 'to': u"orm['scrum.Sprint']"}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '20'}),
+            'story_component': ('django.db.models.fields.CharField', [], {'max_length': '50', 'blank': 'True'}),
+            'story_points': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'story_user': ('django.db.models.fields.CharField', [], {'max_length': '50', 'blank': 'True'}),
+            'summary': ('django.db.models.fields.CharField', [], {'max_length': '500'}),
+            'target_milestone': ('django.db.models.fields.CharField', [], {'max_length': '20', 'blank': 'True'}),
+            'whiteboard': ('django.db.models.fields.CharField', [], {'max_length': '2048', 'blank': 'True'})
+        },
+        u'scrum.bughistorychunk': {
+            'Meta': {'ordering': "('start',)", 'unique_together': "(('bug', 'start'),)", 'object_name': 'BugHistoryChunk'},
+            'bug': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'history_chunks'", 'to': u"orm['scrum.Bug']"}),
+            'entries': ('scrum.models.CompressedJSONField', [], {'default': '{}'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'start': ('django.db.models.fields.PositiveIntegerField', [], {})
+        },
+        u'scrum.bugsprintlog': {
+            'Meta': {'ordering': "('-timestamp',)", 'object_name': 'BugSprintLog'},
+            'action': ('django.db.models.fields.PositiveSmallIntegerField', [], {}),
+            'bug': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sprint_actions'", 'to': u"orm['scrum.Bug']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'sprint': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'bug_actions'", 'to': u"orm['scrum.Sprint']"}),
+            'timestamp': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'})
+        },
+        u'scrum.bugzillaurl': {
+            'Meta': {'ordering': "('id',)", 'object_name': 'BugzillaURL'},
+            'date_synced': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(2026, 9, 17, 0, 0)'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'one_time': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'project': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'urls'", 'null': 'True', 'to': u"orm['scrum.Project']"}),
+            'url': ('django.db.models.fields.URLField', [], {'max_length': '2048'})
+        },
+        u'scrum.bzproduct': {
+            'Meta': {'object_name': 'BZProduct'},
+            'component': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'date_synced': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'project': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'products'", 'to': u"orm['scrum.Project']"})
+        },
+        u'scrum.project': {
+            'Meta': {'ordering': "('name',)", 'object_name': 'Project'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'slug': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50', 'db_index': 'True'}),
+            'team': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'projects'", 'null': 'True', 'to': u"orm['scrum.Team']"})
+        },
+        u'scrum.sprint': {
+            'Meta': {'ordering': "['-start_date']", 'unique_together': "(('team', 'slug'),)", 'object_name': 'Sprint'},
+            'bugs_data_cache': ('jsonfield.fields.JSONField', [], {'null': 'True'}),
+            'bz_url': ('django.db.models.fields.URLField', [], {'max_length': '2048', 'null': 'True', 'blank': 'True'}),
+            'created_date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'end_date': ('django.db.models.fields.DateField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'notes': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'notes_html': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'slug': ('django.db.models.fields.CharField', [], {'max_length': '200', 'db_index': 'True'}),
+            'start_date': ('django.db.models.fields.DateField', [], {}),
+            'team': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sprints'", 'to': u"orm['scrum.Team']"})
+        },
+        u'scrum.team': {
+            'Meta': {'ordering': "('name',)", 'object_name': 'Team'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'slug': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['scrum']
\ No newline at end of file
@@ -6,7 +6,7 @@ import operator
 from django.db.models.query import QuerySet
 import re
 import zlib
-from base64 import b64decode, b64encode
+from base64 import b64decode
 from collections import defaultdict
 from datetime import date, timedelta
 from operator import itemgetter
@@ -14,52 +14,299 @@ from operator import itemgetter
 from django.conf import settings
 from django.core.cache import cache
 from django.core.validators import RegexValidator
-from django.db import models, transaction
+from django.db import connections, models, transaction
 from django.db.models.query_utils import Q
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
+from django.utils.datastructures import SortedDict
 from django.utils.encoding import force_unicode
-from django.utils.timezone import now
+from django.utils.timezone import is_aware, make_aware, now, utc
 
 import dateutil.parser
 from jsonfield import JSONField
 from markdown import markdown
 from model_utils.managers import PassThroughManager
 
-from bugzilla.api import BUG_OPEN_STATUSES, bugzilla, is_closed
-from scrum.utils import (date_to_js, date_range, get_bz_url_for_bug_ids,
-                         get_story_data, parse_bz_url, parse_whiteboard)
+from bugzilla.api import (BUG_CLOSED_STATUSES, BUG_OPEN_STATUSES, bugzilla,
+                          is_closed)
+from scrum.utils import (burndown_totals, daily_values, date_to_js,
+                         date_range, get_bz_url_for_bug_ids, get_story_data,
+                         parse_bz_url, parse_whiteboard,
+                         whiteboard_has_scrum_data)
 
 
 log = logging.getLogger(__name__)
 ALL_COMPONENTS = '__ALL__'
+UNASSIGNED_EMAIL = 'nobody@mozilla.org'
+
+
+def history_entry_time(entry):
+    """
+    Return the aware datetime of a history entry, whether it's fresh from
+    Bugzilla or was stored as JSON.
+    """
+    # TODO remove 'change_time' when all bugs are updated
+    when = entry.get('when') or entry.get('change_time')
+    if isinstance(when, basestring):
+        when = dateutil.parser.parse(when)
+    if not is_aware(when):
+        when = make_aware(when, utc)
+    return when
+
+
+def get_points_timeline(history):
+    """
+    Return the changes in a bug's points from its history, with the points
+    dropping to 0 while it's closed.
+    :return: list of dicts with 'date' and 'points'.
+    """
+    phistory = []
+    cpoints = 0
+    closed = False
+    for h in history:
+        hdate = history_entry_time(h).date()
+        for change in h['changes']:
+            fn = change['field_name']
+            # TODO remove 'status' when all bugs are updated
+            if fn == 'bug_status' or fn == 'status':
+                now_closed = is_closed(change['added'])
+                if closed != now_closed:
+                    pts = 0 if now_closed else cpoints
+                    phistory.append({
+                        'date': hdate,
+                        'points': pts,
+                        })
+                    closed = now_closed
+            elif fn == 'status_whiteboard':
+                pts = get_story_data(change['added'])['points']
+                if pts != cpoints:
+                    cpoints = pts
+                    if not closed:
+                        phistory.append({'date': hdate,
+                                         'points': pts})
+    return phistory
+
+
+def get_field_changes(history, field_names):
+    """
+    Return the changes to any of `field_names` in a bug's history.
+    :return: list of (date, removed, added) tuples.
+    """
+    return [(history_entry_time(h).date(), change['removed'], change['added'])
+            for h in history for change in h['changes']
+            if change['field_name'] in field_names]
+
+
+FLAG_STATUS_NAMES = {
+    '?': 'question',
+    '+': 'plus',
+    '-': 'minus'
+}
+
+
+def get_flags_status(flags, attachments):
+    """
+    Return the status of each flag of a bug and of its current attachments,
+    by flag name: 'question', 'plus', 'minus', 'none', or 'mixed' when the
+    flags with the name differ.
+    :return: dict
+    """
+    # if is_obsolete is True, or is_obsolete field doesn't exist, skip
+    # the attachment.
+    all_flags = list(flags) + [f for a in attachments
+                               if not a.get('is_obsolete', True)
+                               for f in a.get('flags', [])]
+    fs = {}
+    for f in all_flags:
+        flag_name = f.get('name', None)
+        if not flag_name:
+            continue
+        status_name = FLAG_STATUS_NAMES.get(f.get('status', None), 'none')
+        if fs.get(flag_name, status_name) != status_name:
+            status_name = 'mixed'
+        fs[flag_name] = status_name
+    return fs
+
+
+try:
+    import lz4
+except ImportError:
+    lz4 = None
+
+
+# tag byte at the start of the stored bytes to the codec that made them.
+# none of them can start base64 or JSON text, so rows from before the
+# tags were added (base64 of zlib level 9) can still be told apart.
+JSON_CODECS = {
+    'none': ('\x00', lambda data, level: data, lambda data: data),
+    'zlib': ('\x01', zlib.compress, zlib.decompress),
+}
+if lz4 is not None:
+    JSON_CODECS['lz4'] = ('\x02', lambda data, level: lz4.compress(data),
+                          lz4.decompress)
+JSON_CODEC_TAGS = dict((tag, decompress) for tag, compress, decompress
+                       in JSON_CODECS.values())
+JSON_CODEC = getattr(settings, 'COMPRESSED_JSON_CODEC', 'zlib')
+JSON_CODEC_LEVEL = getattr(settings, 'COMPRESSED_JSON_LEVEL', 6)
+
+
+def decode_json_bytes(raw):
+    """
+    Return the JSON text from the stored bytes of a CompressedJSONField,
+    in any of the formats it has used.
+    """
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()
+    elif isinstance(raw, buffer):
+        raw = bytes(raw)
+    elif isinstance(raw, unicode):
+        # text column from before the bytes were stored.
+        raw = raw.encode('utf-8')
+    decompress = JSON_CODEC_TAGS.get(raw[:1])
+    if decompress is not None:
+        return decompress(raw[1:])
+    try:
+        return zlib.decompress(b64decode(raw))
+    except (TypeError, zlib.error):
+        # must not be compressed. leave alone.
+        return raw
+
+
+class StoredJSON(object):
+    """
+    The bytes of a CompressedJSONField as they are in the db.
+    """
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __getstate__(self):
+        return self.raw
+
+    def __setstate__(self, raw):
+        self.raw = raw
+
+
+class CompressedJSONDescriptor(object):
+    """
+    Decodes the stored bytes the first time the field is used, and keeps
+    what was stored so that unchanged values aren't encoded again.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.field.attname]
+        if isinstance(value, StoredJSON):
+            text = decode_json_bytes(value.raw)
+            obj.__dict__[self.field.stored_attname] = (text, value.raw)
+            value = obj.__dict__[self.field.attname] = \
+                JSONField.to_python(self.field, text)
+        return value
+
+    def __set__(self, obj, value):
+        if isinstance(value, (basestring, buffer, memoryview)):
+            value = StoredJSON(value)
+        obj.__dict__[self.field.attname] = value
+
+
+class CompressedJSONFieldBase(models.SubfieldBase):
+    """
+    SubfieldBase, without the descriptor that decodes on every load.
+    """
+
+    def __new__(cls, name, bases, attrs):
+        return type.__new__(cls, name, bases, attrs)
 
 
 class CompressedJSONField(JSONField):
     """
-    Django model field that stores JSON data compressed with zlib.
+    Django model field that stores JSON data compressed, in a binary column.
+
+    :param codec: name of a codec in `JSON_CODECS`. Defaults to the
+                  COMPRESSED_JSON_CODEC setting.
+    :param level: compression level. Defaults to the COMPRESSED_JSON_LEVEL
+                  setting.
     """
-    __metaclass__ = models.SubfieldBase
+    __metaclass__ = CompressedJSONFieldBase
+
+    def __init__(self, *args, **kwargs):
+        self.codec = kwargs.pop('codec', None)
+        self.level = kwargs.pop('level', None)
+        super(CompressedJSONField, self).__init__(*args, **kwargs)
+        # the same value always gives the same text, to tell if it changed.
+        self.encoder_kwargs['sort_keys'] = True
+
+    def contribute_to_class(self, cls, name):
+        super(CompressedJSONField, self).contribute_to_class(cls, name)
+        self.stored_attname = '_%s_stored' % self.attname
+        setattr(cls, self.name, CompressedJSONDescriptor(self))
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def db_type(self, connection):
+        return models.BinaryField().db_type(connection)
 
     def to_python(self, value):
-        if isinstance(value, basestring):
-            try:
-                value = zlib.decompress(b64decode(value))
-            except zlib.error:
-                # must not be compressed. leave alone.
-                pass
+        if isinstance(value, StoredJSON):
+            value = value.raw
+        if isinstance(value, (basestring, buffer, memoryview)):
+            value = decode_json_bytes(value)
         return super(CompressedJSONField, self).to_python(value)
 
+    def encode(self, text):
+        """
+        Return the bytes to store for the JSON `text`.
+        """
+        tag, compress, decompress = JSON_CODECS[self.codec or JSON_CODEC]
+        level = JSON_CODEC_LEVEL if self.level is None else self.level
+        data = compress(text, level)
+        if len(data) >= len(text):
+            # small values like [] only get bigger. plain JSON is read back
+            # as is, and is a default that can go in a migration's SQL.
+            return text
+        return tag + data
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, StoredJSON):
+            # never used, so it can't have changed.
+            return value
+        text = self.get_prep_value(value)
+        if text is None:
+            return None
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        stored = model_instance.__dict__.get(self.stored_attname)
+        if stored is None or stored[0] != text:
+            stored = (text, self.encode(text))
+            model_instance.__dict__[self.stored_attname] = stored
+        return StoredJSON(stored[1])
+
     def get_db_prep_value(self, value, connection=None, prepared=None):
-        value = super(CompressedJSONField, self).get_db_prep_value(value,
-                                                                   connection,
-                                                                   prepared)
-        return b64encode(zlib.compress(value, 9))
+        if isinstance(value, StoredJSON):
+            raw = value.raw
+        else:
+            text = self.get_prep_value(value)
+            if text is None:
+                return None
+            if isinstance(text, unicode):
+                text = text.encode('utf-8')
+            raw = self.encode(text)
+        return connection.Database.Binary(raw)
 
 
 try:
     from south.modelsinspector import add_introspection_rules
-    add_introspection_rules([], ['^scrum\.models\.CompressedJSONField'])
+    add_introspection_rules([([CompressedJSONField], [], {
+        'codec': ['codec', {'default': None}],
+        'level': ['level', {'default': None}],
+    })], ['^scrum\.models\.CompressedJSONField'])
 except ImportError:
     pass
 
@@ -69,6 +316,8 @@ validate_slug = RegexValidator(slug_re, "Enter a valid 'slug' consisting of "
                                "letters, numbers, underscores, periods or "
                                "hyphens.", 'invalid')
 CACHE_BUGS_FOR = getattr(settings, 'CACHE_BUGS_FOR', 2) * 60 * 60  # hours
+# a bug's history chunks are merged into one once it has this many.
+HISTORY_MAX_CHUNKS = getattr(settings, 'HISTORY_MAX_CHUNKS', 10)
 
 
 class BZError(IOError):
@@ -126,9 +375,8 @@ class DBBugsMixin(object):
         if 'bug_filters' in kwargs:
             bugs = bugs.filter(**kwargs['bug_filters'])
         if self.scrum_only:
-            num_bugs = bugs.count()
+            self.num_no_data_bugs = bugs.filter(has_scrum_data=False).count()
             bugs = bugs.scrum_only()
-            self.num_no_data_bugs = num_bugs - bugs.count()
         if kwargs.get('refresh', False):
             self.refresh_bugs_data(bugs)
         return bugs
@@ -266,11 +514,35 @@ class BZProductManager(models.Manager):
     def _reset_full_list(self):
         cache.delete(self._full_list_cache_key)
 
+    def get_sync_watermark(self, name, component=ALL_COMPONENTS):
+        """
+        Return the Bugzilla last change time up to which the bugs in a
+        product and component have been synced.
+        :return: datetime, or None if a full sync is required.
+        """
+        dates = list(self.filter(name=name, component=component)
+                         .values_list('date_synced', flat=True))
+        if not dates or None in dates:
+            return None
+        return min(dates)
+
+    def set_sync_watermark(self, name, component, date_synced):
+        """
+        Move the sync watermark of a product and component forward.
+        """
+        # update() so that the post_save sync doesn't fire again.
+        self.filter(Q(date_synced__isnull=True) |
+                    Q(date_synced__lt=date_synced),
+                    name=name, component=component) \
+            .update(date_synced=date_synced)
+
 
 class BZProduct(models.Model):
     name = models.CharField(max_length=200)
     component = models.CharField(max_length=200)
     project = models.ForeignKey(Project, related_name='products')
+    # Bugzilla last_change_time of the newest bug seen when syncing.
+    date_synced = models.DateTimeField(null=True, editable=False)
 
     objects = BZProductManager()
 
@@ -295,6 +567,8 @@ class Sprint(DBBugsMixin, BugsListMixin, models.Model):
         get_latest_by = 'created_date'
         ordering = ['-start_date']
         unique_together = ('team', 'slug')
+        # the sprints running on a day.
+        index_together = [('start_date', 'end_date')]
 
     def __unicode__(self):
         return u'{0} - {1}'.format(self.team.name, self.name)
@@ -346,17 +620,112 @@ class Sprint(DBBugsMixin, BugsListMixin, models.Model):
     def get_burndown(self):
         """Return a list of total point values per day of sprint"""
         today = now().date()
-        sdate = self.start_date
-        edate = self.end_date if self.end_date < today else today
-        if sdate > today:
+        if self.start_date > today:
             return []
-        tseries = []
-        for cdate in date_range(sdate, edate):
-            cpoints = 0
-            for bug in self.get_bugs():
-                cpoints += bug.points_for_date(cdate)
-            tseries.append([date_to_js(cdate), cpoints])
-        return tseries
+        dates = date_range(self.start_date, min(self.end_date, today))
+        points = dict(self.snapshots.filter(date__range=(dates[0], dates[-1]))
+                                    .values_list('date', 'points_remaining'))
+        if len(points) < len(dates):
+            # the tasks store the missing days; work them out until then.
+            for cdate, cpoints in self._get_points_remaining(dates).items():
+                points.setdefault(cdate, cpoints)
+        return [[date_to_js(cdate), points[cdate]] for cdate in dates]
+
+    def _get_points_remaining(self, dates, story_points=None):
+        """
+        Return a dict of date to the points remaining on it, from the points
+        changes of the bugs.
+        :param dates: the days of the sprint so far.
+        :param story_points: dict of bug id to its current points.
+        """
+        if story_points is None:
+            story_points = dict(self.get_bugs().values_list('id',
+                                                            'story_points'))
+        changes = BugPointsChange.objects.filter(
+            bug__in=story_points.keys(),
+        ).order_by('bug', 'date', 'id').values_list('bug', 'date', 'points')
+        return dict(zip(dates, burndown_totals(dates[0], len(dates),
+                                               story_points, list(changes))))
+
+    @transaction.atomic
+    def update_snapshots(self, days=None):
+        """
+        Store a snapshot for each day of the sprint so far that doesn't have
+        one, and replace the snapshots of `days`. Only the tasks store them;
+        `get_burndown` works out the missing days without storing them.
+        :param days: list of dates. Default: today.
+        """
+        today = now().date()
+        if self.start_date > today:
+            return
+        if days is None:
+            days = [today]
+        # one update of a sprint's snapshots at a time.
+        list(Sprint.objects.select_for_update().filter(id=self.id))
+        dates = date_range(self.start_date, min(self.end_date, today))
+        stored = set(self.snapshots.filter(date__range=(dates[0], dates[-1]))
+                                   .values_list('date', flat=True))
+        new_dates = [cdate for cdate in dates
+                     if cdate in days or cdate not in stored]
+        if not new_dates:
+            return
+        snapshots = self._build_snapshots(dates, new_dates)
+        self.snapshots.filter(date__in=new_dates).delete()
+        SprintDailySnapshot.objects.bulk_create(snapshots)
+
+    def _build_snapshots(self, dates, new_dates):
+        """
+        Return the unsaved snapshots of `new_dates`.
+
+        The points remaining are worked out from the points changes of the
+        bugs. A bug counts from the day it was created, with the status and
+        story points it had at the end of each day, from its history.
+        :param dates: the days of the sprint so far.
+        """
+        today = now().date()
+        bugs = list(self.get_bugs())
+        story_points = dict((bug.id, bug.story_points) for bug in bugs)
+        remaining = self._get_points_remaining(dates, story_points)
+        past = any(cdate < today for cdate in new_dates)
+        if past:
+            Bug.objects.load_history(bugs)
+        snapshots = SortedDict(
+            (cdate, SprintDailySnapshot(sprint=self, date=cdate,
+                                        points_remaining=remaining[cdate],
+                                        total_points=0, total_bugs=0,
+                                        status=defaultdict(int)))
+            for cdate in new_dates)
+        for bug in bugs:
+            if past:
+                status = daily_values(
+                    dates[0], len(dates), bug.status,
+                    get_field_changes(bug.history, ('bug_status', 'status')))
+                whiteboards = daily_values(
+                    dates[0], len(dates), bug.whiteboard,
+                    get_field_changes(bug.history, ('status_whiteboard',)))
+            else:
+                status = [bug.status] * len(dates)
+                whiteboards = [bug.whiteboard] * len(dates)
+            created = bug.creation_time.date()
+            for cdate, cstatus, whiteboard in zip(dates, status, whiteboards):
+                snapshot = snapshots.get(cdate)
+                if snapshot is None or created > cdate:
+                    continue
+                if whiteboard == bug.whiteboard:
+                    snapshot.total_points += bug.story_points
+                else:
+                    snapshot.total_points += \
+                        get_story_data(whiteboard)['points']
+                snapshot.total_bugs += 1
+                snapshot.status[cstatus] += 1
+        for snapshot in snapshots.values():
+            snapshot.status = dict(snapshot.status)
+        return snapshots.values()
+
+    def update_bugs(self, add=None, remove=None):
+        super(Sprint, self).update_bugs(add, remove)
+        from scrum.tasks import update_sprint_data
+        update_sprint_data.delay([self.id])
 
     def get_burndown_axis(self):
         """Return a list of epoch dates between sprint start and end
@@ -388,6 +757,24 @@ class Sprint(DBBugsMixin, BugsListMixin, models.Model):
             BugSprintLog.objects.removed_from_sprint(bug, self)
 
 
+class SprintDailySnapshot(models.Model):
+    """
+    The totals of a sprint's bugs at the end of a day, so that the burndown
+    for the days that are over doesn't need working out again.
+    """
+    sprint = models.ForeignKey(Sprint, related_name='snapshots')
+    date = models.DateField()
+    points_remaining = models.PositiveIntegerField()
+    total_points = models.PositiveIntegerField()
+    total_bugs = models.PositiveIntegerField()
+    # number of bugs in each status.
+    status = JSONField(blank=True)
+
+    class Meta:
+        ordering = ('date',)
+        unique_together = ('sprint', 'date')
+
+
 class BugzillaURL(models.Model):
     url = models.URLField(verbose_name='Bugzilla URL', max_length=2048)
     project = models.ForeignKey(Project, null=True, blank=True,
@@ -477,10 +864,7 @@ class BugQuerySet(QuerySet):
         Only include bugs that have some data in the `story_*` fields.
         :return: QuerySet
         """
-        return self.filter(Q(whiteboard__contains='u=') |
-                           Q(whiteboard__contains='c=') |
-                           Q(whiteboard__contains='p=') |
-                           Q(whiteboard__contains='s='))
+        return self.filter(has_scrum_data=True)
 
     def open(self):
         """
@@ -519,52 +903,75 @@ class BugQuerySet(QuerySet):
 
     def get_blocked(self):
         """
-        Return a list of bug IDs from this QS that have open blocking bugs.
+        Return a dict of the ids of the bugs in this QS that have open
+        blocking bugs to lists of those blockers.
         """
-        blocker_to_bug = defaultdict(list)
-        for bug in self.only('id', 'depends_on'):
-            for dep_id in bug.depends_on:
-                blocker_to_bug[dep_id].append(bug.id)
-        open_blockers = Bug.objects.filter(id__in=blocker_to_bug.keys()) \
-                           .open()
-        open_blocker = dict((b.id, b) for b in open_blockers)
+        deps = BugDependency.objects.filter(
+            blocked__in=self.order_by().values('id'),
+            blocker__status__in=BUG_OPEN_STATUSES,
+        ).select_related('blocker').defer(
+            'blocker__history_base', 'blocker__flags', 'blocker__attachments',
+        ).order_by('blocker')
         all_blocked = defaultdict(list)
-        for blocker, blocked in blocker_to_bug.iteritems():
-            if blocker in open_blocker:
-                for bid in blocked:
-                    all_blocked[bid].append(open_blocker[blocker])
+        for dep in deps:
+            all_blocked[dep.blocked_id].append(dep.blocker)
         return all_blocked
 
     def get_flagged(self):
         """
         Return a list of bug ids of bugs with flags
         """
-        flags = []
-        for bug in self.open():
-            if bug.bucketed_flags:
-                flags.append(bug.id)
-        return flags
+        return list(self.open().filter(has_flags=True)
+                               .values_list('id', flat=True))
 
     def get_aggregate_data(self):
-        bugs = self.all()
+        """
+        Return the points per user, component, status and basic status,
+        summed by the database.
+        """
         data = {
             'users': defaultdict(int),
             'components': defaultdict(int),
             'status': defaultdict(int),
             'basic_status': defaultdict(int),
             'total_points': 0,
-            'total_bugs': len(bugs),
+            'total_bugs': 0,
             'scoreless_bugs': 0,
         }
-        for bug in bugs:
-            if bug.story_points:
-                data['users'][bug.story_user] += bug.story_points
-                data['components'][bug.real_component] += bug.story_points
-                data['status'][bug.status] += bug.story_points
-                data['basic_status'][bug.basic_status] += bug.story_points
-                data['total_points'] += bug.story_points
-            else:
-                data['scoreless_bugs'] += 1
+        qn = connections[self.db].ops.quote_name
+        column = '%s.%%s' % qn(self.model._meta.db_table)
+        # the same as Bug.real_component and Bug.basic_status.
+        select = SortedDict([
+            ('real_component', "CASE WHEN {0} = '' THEN {1} ELSE {0} END"
+                               .format(column % qn('story_component'),
+                                       column % qn('component'))),
+            ('basic_status', "CASE WHEN {0} IN ({1}) THEN 'closed' "
+                             "WHEN {2} = %s THEN 'open' "
+                             "ELSE 'assigned' END".format(
+                                 column % qn('status'),
+                                 ', '.join('%s' for s in BUG_CLOSED_STATUSES),
+                                 column % qn('assigned_to'))),
+            ('scored', 'CASE WHEN {0} > 0 THEN 1 ELSE 0 END'
+                       .format(column % qn('story_points'))),
+        ])
+        rows = self.order_by().extra(
+            select=select,
+            select_params=list(BUG_CLOSED_STATUSES) + [UNASSIGNED_EMAIL],
+        ).values(
+            'story_user', 'real_component', 'status', 'basic_status',
+            'scored',
+        ).annotate(points=models.Sum('story_points'),
+                   num_bugs=models.Count('id'))
+        for row in rows:
+            data['total_bugs'] += row['num_bugs']
+            if not row['scored']:
+                data['scoreless_bugs'] += row['num_bugs']
+                continue
+            data['users'][row['story_user']] += row['points']
+            data['components'][row['real_component']] += row['points']
+            data['status'][row['status']] += row['points']
+            data['basic_status'][row['basic_status']] += row['points']
+            data['total_points'] += row['points']
         data['points_remaining'] = (data['total_points'] -
                                     data['basic_status']['closed'])
         return data
@@ -584,6 +991,45 @@ class BugManager(PassThroughManager):
     def get_query_set(self):
         return BugQuerySet(self.model, using=self._db)
 
+    def get_changed_ids(self, change_times):
+        """
+        Return the ids of the bugs that changed in Bugzilla since they were
+        stored, and mark the rest as synced.
+        :param change_times: dict of bug id to Bugzilla last change time.
+        :return: list of bug ids.
+        """
+        stored = dict(self.filter(id__in=change_times.keys())
+                          .values_list('id', 'last_change_time'))
+        changed = []
+        unchanged = []
+        for bid, last_change_time in change_times.iteritems():
+            if stored.get(bid) == last_change_time:
+                unchanged.append(bid)
+            else:
+                changed.append(bid)
+        if unchanged:
+            self.filter(id__in=unchanged).update(last_synced_time=now())
+        return sorted(changed)
+
+    def get_history_times(self, bug_ids):
+        """
+        Return a dict of bug id to the time of its newest stored history
+        entry, for the bugs that have one.
+        """
+        return dict(self.filter(id__in=bug_ids, history_time__isnull=False)
+                        .values_list('id', 'history_time'))
+
+    def get_comment_marks(self, bug_ids):
+        """
+        Return a dict of bug id to a tuple of (last change time, comments
+        count), to count only the comments after that change.
+        """
+        return dict((bid, (last_change_time, count)) for
+                    bid, last_change_time, count in
+                    self.filter(id__in=bug_ids)
+                        .values_list('id', 'last_change_time',
+                                     'comments_count'))
+
     def update_or_create(self, data):
         """
         Create or update a bug from the data returned from Bugzilla.
@@ -592,18 +1038,162 @@ class BugManager(PassThroughManager):
         """
         defaults = data.copy()
         bid = defaults.pop('id')
+        # only the history since what's stored; see `Bug.append_history`.
+        new_history = defaults.pop('new_history', None)
         bug, created = self.get_or_create(id=bid, defaults=defaults)
         if not created:
             bug.fill_from_data(defaults)
+            if new_history is not None:
+                bug.append_history(new_history)
             bug.save()
         log.info('updated bug %s', bug.id)
         cache.set('bug:updated:%s' % bug.id, True, 35)
         return bug, created
 
+    def load_history(self, bugs):
+        """
+        Load the full history of the `bugs` that don't have it yet, in one
+        query for all of their chunks.
+        """
+        load_history = dict((bug.id, list(bug.history_base or []))
+                            for bug in bugs if bug._history is None)
+        if not load_history:
+            return
+        for chunk in BugHistoryChunk.objects.filter(
+                bug__in=load_history.keys()).order_by('bug', 'start'):
+            load_history[chunk.bug_id].extend(chunk.entries)
+        for bug in bugs:
+            if bug.id in load_history:
+                bug._history = load_history[bug.id]
+
+    def _update_changed(self, changed, synced):
+        """
+        Save the changed fields of stored bugs, and their sync time, in one
+        UPDATE. Each changed column is set with a CASE on the bug id.
+        :param changed: dict of bug id to the dict of field name to value
+                        from `Bug._get_changed_values`.
+        :param synced: the new `last_synced_time` of all of them.
+        """
+        if not changed:
+            return
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        pk_column = qn(opts.pk.column)
+        synced_field = opts.get_field('last_synced_time')
+        fields = [opts.get_field(name) for name in
+                  sorted(set(name for values in changed.values()
+                             for name in values))]
+        ids = sorted(changed)
+        # sqlite has a limit on the number of parameters in a query.
+        batch_size = connection.ops.bulk_batch_size(
+            [opts.pk, synced_field] + fields * 2, ids)
+        cursor = connection.cursor()
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            sets = ['%s = %%s' % qn(synced_field.column)]
+            params = [synced_field.get_db_prep_save(synced,
+                                                    connection=connection)]
+            for field in fields:
+                whens = []
+                for bid in batch:
+                    if field.name in changed[bid]:
+                        whens.append('WHEN %s THEN %s')
+                        params.extend([bid, field.get_db_prep_save(
+                            changed[bid][field.name], connection=connection)])
+                if whens:
+                    column = qn(field.column)
+                    sets.append('%s = CASE %s %s ELSE %s END' % (
+                        column, pk_column, ' '.join(whens), column))
+            params.extend(batch)
+            cursor.execute('UPDATE %s SET %s WHERE %s IN (%s)' % (
+                qn(opts.db_table), ', '.join(sets), pk_column,
+                ', '.join('%s' for bid in batch)), params)
+
+    def update_or_create_many(self, bugs_data):
+        """
+        Create or update bugs from the data returned from Bugzilla, the same
+        as `update_or_create` on each of them but in a few queries: one for
+        the stored bugs, one to create the new ones and one to update only
+        the changed fields of the others.
+        :param bugs_data: list of dicts of bug data from the bugzilla api.
+        :return: list of Bug instances.
+        """
+        stored = self.select_related('sprint').in_bulk(
+            [data['id'] for data in bugs_data])
+        synced = now()
+        bugs = SortedDict()
+        new_bugs = []
+        old_values = {}
+        for data in bugs_data:
+            defaults = data.copy()
+            bid = defaults.pop('id')
+            new_history = defaults.pop('new_history', None)
+            bug = bugs.get(bid) or stored.get(bid)
+            if bug is None:
+                bug = self.model(id=bid, **defaults)
+                new_bugs.append(bug)
+            else:
+                if not bug._state.adding:
+                    # what's stored, to update only the fields that changed.
+                    old_values.setdefault(bid, bug.__dict__.copy())
+                bug.fill_from_data(defaults)
+                if new_history is not None:
+                    bug.append_history(new_history)
+            bug.last_synced_time = synced
+            bugs[bid] = bug
+        bugs = bugs.values()
+
+        # what the pre_save receivers do when saving them one at a time.
+        for bug in bugs:
+            update_scrum_data(sender=self.model, instance=bug)
+        moves = move_to_sprints(bugs)
+        history_saves = dict((bug.id, bug._prepare_history_save())
+                             for bug in bugs)
+
+        self.bulk_create(new_bugs)
+        for bug in new_bugs:
+            bug._state.adding = False
+            bug._state.db = self.db
+        changed = {}
+        for bid, old in old_values.items():
+            changed[bid] = stored[bid]._get_changed_values(
+                old, history_saves[bid][1])
+            changed[bid].pop('last_synced_time', None)
+        self._update_changed(changed, synced)
+
+        BugHistoryChunk.objects.bulk_create([
+            BugHistoryChunk(bug=bug, **history_saves[bug.id][0])
+            for bug in bugs if history_saves[bug.id][0]])
+        BugSprintLog.objects.log_moves(moves)
+        # the points changes of the bugs with new history.
+        points_bugs = [bug for bug in bugs if any(history_saves[bug.id])]
+        self.load_history(points_bugs)
+        if points_bugs:
+            BugPointsChange.objects.filter(bug__in=points_bugs).delete()
+            BugPointsChange.objects.bulk_create([
+                change for bug in points_bugs
+                for change in bug._get_points_changes()])
+
+        for bug in bugs:
+            log.info('updated bug %s', bug.id)
+        cache.set_many(dict(('bug:updated:%s' % bug.id, True)
+                            for bug in bugs), 35)
+        return bugs
+
 
 class Bug(models.Model):
     id = models.PositiveIntegerField(primary_key=True)
-    history = CompressedJSONField(blank=True)
+    # history from before it was stored in `history_chunks`.
+    history_base = CompressedJSONField(blank=True, db_column='history')
+    # high-water mark: number of history entries stored. None for bugs
+    # with all of their history in `history_base`.
+    history_count = models.PositiveIntegerField(null=True, editable=False)
+    # time of the newest stored history entry, to fetch only newer ones.
+    history_time = models.DateTimeField(null=True, editable=False)
+    # number of `history_chunks`, to merge them before there are too many.
+    history_chunk_count = models.PositiveSmallIntegerField(default=0,
+                                                           editable=False)
     last_synced_time = models.DateTimeField(default=now)
     product = models.CharField(max_length=200)
     component = models.CharField(max_length=200)
@@ -617,6 +1207,10 @@ class Bug(models.Model):
     depends_on = JSONField(blank=True)
     flags = CompressedJSONField(blank=True)
     attachments = CompressedJSONField(blank=True)
+    # summary of `flags` and `attachments`; see `update_flags_summary`.
+    has_flags = models.BooleanField(default=False, db_index=True,
+                                    editable=False)
+    flags_status = JSONField(blank=True, editable=False)
     comments_count = models.PositiveSmallIntegerField(default=0)
     creation_time = models.DateTimeField(default=now)
     last_change_time = models.DateTimeField(default=now)
@@ -625,6 +1219,9 @@ class Bug(models.Model):
     story_user = models.CharField(max_length=50, blank=True)
     story_component = models.CharField(max_length=50, blank=True)
     story_points = models.PositiveSmallIntegerField(default=0)
+    # whether the whiteboard has any of the scrum tags.
+    has_scrum_data = models.BooleanField(default=False, db_index=True,
+                                         editable=False)
 
     sprint = models.ForeignKey(Sprint, related_name='bugs', null=True,
                                on_delete=models.SET_NULL)
@@ -632,18 +1229,180 @@ class Bug(models.Model):
                                 on_delete=models.SET_NULL)
 
     objects = BugManager()
-    flag_status_names = {
-        '?': 'question',
-        '+': 'plus',
-        '-': 'minus'
-    }
+
+    _history = None
+    _new_history = None
+    _appended_history = None
 
     class Meta:
         ordering = ('id',)
+        index_together = [
+            # by_products().open(), for project backlogs and syncs.
+            ('product', 'component', 'status'),
+            # open bugs not in a sprint, for team backlogs, and those in
+            # the running sprints of a project.
+            ('project', 'sprint', 'status'),
+            # sprint bugs with scrum data.
+            ('sprint', 'has_scrum_data'),
+        ]
 
     def __unicode__(self):
         return unicode(self.id)
 
+    def save(self, *args, **kwargs):
+        new_chunk, rewrite = self._prepare_history_save()
+        if not (rewrite or self._deferred or kwargs.get('update_fields')):
+            # don't recompress and rewrite the history that's already there.
+            kwargs['update_fields'] = [f.name for f in self._meta.fields
+                                       if not (f.primary_key or
+                                               f.name == 'history_base')]
+        super(Bug, self).save(*args, **kwargs)
+        if new_chunk:
+            BugHistoryChunk.objects.create(bug=self, **new_chunk)
+        if new_chunk or rewrite:
+            self.update_points_changes()
+
+    def _get_changed_values(self, old, rewrite=False):
+        """
+        Return a dict of field name to the value to save, for the fields
+        that changed since `old`, a copy of the instance's `__dict__`.
+        `history_base` is only included if it was rewritten.
+        """
+        changed = {}
+        for f in self._meta.fields:
+            if f.primary_key or (f.name == 'history_base' and not rewrite):
+                continue
+            value = f.pre_save(self, False)
+            old_value = old.get(f.attname)
+            if value is old_value:
+                # includes compressed values that were never used.
+                continue
+            if isinstance(f, CompressedJSONField) and \
+                    isinstance(value, StoredJSON) and \
+                    isinstance(old_value, StoredJSON):
+                same = (decode_json_bytes(old_value.raw) ==
+                        self.__dict__[f.stored_attname][0])
+            else:
+                try:
+                    same = value == old_value
+                except TypeError:
+                    # naive and aware datetimes.
+                    same = False
+            if not same:
+                changed[f.name] = value
+        return changed
+
+    def _prepare_history_save(self):
+        """
+        Work out what to store of the new or appended history on save.
+        :return: tuple (kwargs for the new chunk or None,
+                        whether `history_base` changed)
+        """
+        new_chunk = None
+        rewrite = self._state.adding
+        if self._new_history is not None:
+            new_chunk, rewrite = self._prepare_history(self._new_history)
+            self._new_history = None
+        elif self._appended_history:
+            new_chunk = self._prepare_appended_history(self._appended_history)
+        self._appended_history = None
+        return new_chunk, rewrite
+
+    @property
+    def history(self):
+        """
+        The full list of history entries, rebuilt from the stored chunks
+        the first time it's used.
+        """
+        if self._history is None:
+            history = list(self.history_base or [])
+            for chunk in self.history_chunks.all():
+                history.extend(chunk.entries)
+            self._history = history
+        return self._history
+
+    @history.setter
+    def history(self, history):
+        self._history = self._new_history = history
+
+    def _prepare_history(self, history):
+        """
+        Work out what to store of the new full `history` on save and set
+        the high-water mark.
+        :return: tuple (kwargs for the new chunk or None,
+                        whether `history_base` changed)
+        """
+        stored = self.history_count
+        if stored is None:
+            stored = len(self.history_base or [])
+        rewrite = self._state.adding or len(history) < stored
+        if rewrite:
+            # new bug, or the history was rewritten; start over.
+            if not self._state.adding:
+                self.history_chunks.all().delete()
+            self.history_base = []
+            self.history_chunk_count = 0
+            stored = 0
+        self.history_count = len(history)
+        self.history_time = (history_entry_time(history[-1]) if history
+                             else None)
+        new_chunk = None
+        if len(history) > stored:
+            new_chunk = self._new_chunk(stored, history[stored:])
+        return new_chunk, rewrite
+
+    def _prepare_appended_history(self, entries):
+        """
+        Move the high-water mark past the appended `entries`.
+        :return: kwargs for the new chunk.
+        """
+        stored = self.history_count
+        if stored is None:
+            stored = len(self.history_base or [])
+        self.history_count = stored + len(entries)
+        return self._new_chunk(stored, entries)
+
+    def _new_chunk(self, start, entries):
+        """
+        Return the kwargs for a new chunk of the history `entries` from
+        position `start`. Once the bug has `HISTORY_MAX_CHUNKS` chunks they
+        are merged into the new one, so that reading the history never
+        decodes more rows than that.
+        """
+        if self.history_chunk_count >= HISTORY_MAX_CHUNKS:
+            chunks = list(self.history_chunks.all())
+            if chunks:
+                merged = []
+                for chunk in chunks:
+                    merged.extend(chunk.entries)
+                start = chunks[0].start
+                entries = merged + entries
+                self.history_chunks.all().delete()
+            self.history_chunk_count = 0
+        self.history_chunk_count += 1
+        return {'start': start, 'entries': entries}
+
+    def append_history(self, entries):
+        """
+        Add the history entries fetched from Bugzilla since `history_time`,
+        without loading the history that's already stored.
+
+        The entries may have been fetched since an earlier time for the
+        whole chunk of bugs, so the ones already stored are skipped.
+        """
+        if self._new_history is not None:
+            self.history = self._new_history + entries
+            return
+        if self.history_time is not None:
+            entries = [h for h in entries
+                       if history_entry_time(h) > self.history_time]
+        if not entries:
+            return
+        self._appended_history = (self._appended_history or []) + entries
+        if self._history is not None:
+            self._history = self._history + entries
+        self.history_time = history_entry_time(entries[-1])
+
     def projects_from_product(self):
         prodcomps = BZProduct.objects.filter(
             name=self.product,
@@ -676,7 +1435,7 @@ class Bug(models.Model):
         return is_closed(self.status)
 
     def is_assigned(self):
-        return self.assigned_to != 'nobody@mozilla.org'
+        return self.assigned_to != UNASSIGNED_EMAIL
 
     def points_for_date(self, date):
         cpoints = self.story_points
@@ -721,13 +1480,6 @@ class Bug(models.Model):
     def real_component(self):
         return self.story_component or self.component
 
-    @property
-    def has_scrum_data(self):
-        return bool('u=' in self.whiteboard or
-                    'c=' in self.whiteboard or
-                    'p=' in self.whiteboard or
-                    's=' in self.whiteboard)
-
     def _bucket_flag(self, f):
         name = f.get('name', None)
         if not name:
@@ -782,76 +1534,93 @@ class Bug(models.Model):
         self._bucketed_flags = bf
         return self._bucketed_flags
 
-    def _flag_status_name(self, status):
-        return self.flag_status_names.get(status, 'none')
+    def update_flags_summary(self):
+        """
+        Store whether the bug has flags and the status of each, so that bug
+        lists don't need to decode the flags and attachments.
+        """
+        self.flags_status = get_flags_status(self.flags, self.attachments)
+        self.has_flags = bool(self.flags_status)
 
-    def _bucket_flag_status(self, flag, fs):
-        flag_name = flag.get('name', None)
-        if not flag_name:
-            return {}
+    @property
+    def points_history(self):
+        if not hasattr(self, '_points_history'):
+            self._points_history = [{'date': c.date, 'points': c.points}
+                                    for c in self.points_changes.all()]
+        return self._points_history
 
-        status_name = self._flag_status_name(flag.get('status', None))
-        if fs.get(flag_name, None) is None or status_name == fs[flag_name]:
-            return {flag_name: status_name}
-        else:
-            return {flag_name: 'mixed'}
+    def update_points_changes(self):
+        """
+        Store the points timeline worked out from the full history.
+        """
+        self.points_changes.all().delete()
+        BugPointsChange.objects.bulk_create(self._get_points_changes())
 
-    @property
-    def flags_status(self):
-        # do we have cached values?
-        if hasattr(self, '_flags_status'):
-            return self._flags_status
+    def _get_points_changes(self):
+        """
+        Work out the points timeline from the full history.
+        :return: list of unsaved BugPointsChange.
+        """
+        phistory = get_points_timeline(self.history)
+        self._points_history = phistory
+        return [BugPointsChange(bug=self, date=c['date'], points=c['points'])
+                for c in phistory]
 
-        fs = {}
 
-        # update the status for each flag bucket
-        for f in self.flags:
-            fs.update(self._bucket_flag_status(f, fs))
+class BugHistoryChunk(models.Model):
+    """
+    History entries of a bug that were new in a sync.
+    """
+    bug = models.ForeignKey(Bug, related_name='history_chunks')
+    # position of the first entry in the bug's full history.
+    start = models.PositiveIntegerField()
+    entries = CompressedJSONField()
 
-        # go through attachment flags too
-        for a in self.attachments:
-            # if is_obsolete is True, or is_obsolete field doesn't exist,
-            # skip this attachment
-            if a.get('is_obsolete', True):
-                continue
+    class Meta:
+        ordering = ('start',)
+        unique_together = ('bug', 'start')
 
-            for f in a.get('flags', []):
-                fs.update(self._bucket_flag_status(f, fs))
 
-        self._flags_status = fs
-        return self._flags_status
+class BugPointsChange(models.Model):
+    """
+    A change in the points of a bug, worked out from its history when it's
+    stored so that burndowns don't need the history.
+    """
+    bug = models.ForeignKey(Bug, related_name='points_changes')
+    date = models.DateField()
+    points = models.PositiveSmallIntegerField()
 
-    @property
-    def points_history(self):
-        if not hasattr(self, '_points_history'):
-            phistory = []
-            cpoints = 0
-            closed = False
-            for h in self.history:
-                # TODO remove 'change_time' when all bugs are updated
-                hdate = dateutil.parser.parse(h.get('when') or
-                                              h.get('change_time')).date()
-                for change in h['changes']:
-                    fn = change['field_name']
-                    # TODO remove 'status' when all bugs are updated
-                    if fn == 'bug_status' or fn == 'status':
-                        now_closed = is_closed(change['added'])
-                        if closed != now_closed:
-                            pts = 0 if now_closed else cpoints
-                            phistory.append({
-                                'date': hdate,
-                                'points': pts,
-                                })
-                            closed = now_closed
-                    elif fn == 'status_whiteboard':
-                        pts = get_story_data(change['added'])['points']
-                        if pts != cpoints:
-                            cpoints = pts
-                            if not closed:
-                                phistory.append({'date': hdate,
-                                                 'points': pts})
-            self._points_history = phistory
-        return self._points_history
+    class Meta:
+        # changes on the same day are in the order they happened.
+        ordering = ('date', 'id')
+        index_together = [('bug', 'date')]
+
+
+class BugDependencyManager(models.Manager):
+    def set_for_bugs(self, bugs):
+        """
+        Replace the stored dependencies of `bugs` with their `depends_on`.
+        """
+        self.filter(blocked__in=[bug.id for bug in bugs]).delete()
+        self.bulk_create([BugDependency(blocked_id=bug.id, blocker_id=bid)
+                          for bug in bugs
+                          for bid in set(bug.depends_on or [])])
+
+
+class BugDependency(models.Model):
+    """
+    A bug blocked by another, from the blocked bug's `depends_on`. The
+    blocker may not be stored, and the row stays when it is deleted.
+    """
+    blocked = models.ForeignKey(Bug, related_name='blocker_deps')
+    blocker = models.ForeignKey(Bug, related_name='blocked_deps',
+                                db_constraint=False,
+                                on_delete=models.DO_NOTHING)
+
+    objects = BugDependencyManager()
+
+    class Meta:
+        unique_together = ('blocked', 'blocker')
 
 
 class BugSprintLogManager(models.Manager):
@@ -866,6 +1635,22 @@ class BugSprintLogManager(models.Manager):
         log.debug('Removing %s from %s', bug, sprint)
         self._record_action(bug, sprint, BugSprintLog.REMOVED)
 
+    def log_moves(self, moves):
+        """
+        Record the moves of bugs between sprints in one query.
+        :param moves: list of (bug, old sprint or None, new sprint) tuples.
+        """
+        actions = []
+        for bug, old_sprint, new_sprint in moves:
+            if old_sprint:
+                log.debug('Removing %s from %s', bug, old_sprint)
+                actions.append(BugSprintLog(bug=bug, sprint=old_sprint,
+                                            action=BugSprintLog.REMOVED))
+            log.debug('Adding %s to %s', bug, new_sprint)
+            actions.append(BugSprintLog(bug=bug, sprint=new_sprint,
+                                        action=BugSprintLog.ADDED))
+        self.bulk_create(actions)
+
 
 class BugSprintLog(models.Model):
     ADDED = 0
@@ -891,15 +1676,11 @@ class BugSprintLog(models.Model):
         return u'Bug %d %s Sprint %d' % (self.bug_id, action, self.sprint_id)
 
 
-@transaction.commit_on_success
+@transaction.atomic
 def store_bugs(bugs):
-    bug_objs = []
-    update_sprints = set()
-    for bug in bugs.get('bugs', []):
-        bug_obj = Bug.objects.update_or_create(bug)[0]
-        bug_objs.append(bug_obj)
-        if bug_obj.sprint:
-            update_sprints.add(bug_obj.sprint.id)
+    bug_objs = Bug.objects.update_or_create_many(bugs.get('bugs', []))
+    update_sprints = set(bug.sprint_id for bug in bug_objs if bug.sprint_id)
+    BugDependency.objects.set_for_bugs(bug_objs)
     if update_sprints:
         from scrum.tasks import update_sprint_data
         update_sprint_data.delay(list(update_sprints))
@@ -941,48 +1722,71 @@ def get_bzproducts_dict(qs):
 def update_scrum_data(sender, instance, **kwargs):
     for k, v in instance.scrum_data.items():
         setattr(instance, 'story_' + k, v)
+    instance.has_scrum_data = whiteboard_has_scrum_data(instance.whiteboard)
+    # flags and attachments that were never used can't have changed.
+    if not all(isinstance(instance.__dict__.get(name), StoredJSON)
+               for name in ('flags', 'attachments')):
+        instance.update_flags_summary()
 
 
 TM_RE = re.compile(r'\d{4}-\d{2}-\d{2}$')
 
 
-@receiver(pre_save, sender=Bug)
-def move_to_sprint(sender, instance, **kwargs):
-    if not instance.has_scrum_data:
-        return
-    wb_data = parse_whiteboard(instance.whiteboard)
-    newsprint = None
-    if 's' in wb_data:
-        newsprint = wb_data['s']
-    elif instance.target_milestone and instance.target_milestone != '---' \
-            and TM_RE.match(instance.target_milestone):
-        newsprint = instance.target_milestone
-
-    if newsprint:
-        if instance.sprint and newsprint == instance.sprint.slug:
-            # already in the sprint
-            return
-
+def move_to_sprints(bugs):
+    """
+    Move the bugs to the sprint named in their whiteboards or target
+    milestones, in the team of the first project following their product
+    that has a sprint of that name.
+    :return: list of (bug, old sprint or None, new sprint) tuples.
+    """
+    wanted = []
+    for bug in bugs:
+        if not bug.has_scrum_data:
+            continue
+        wb_data = parse_whiteboard(bug.whiteboard)
+        newsprint = None
+        if 's' in wb_data:
+            newsprint = wb_data['s']
+        elif bug.target_milestone and bug.target_milestone != '---' \
+                and TM_RE.match(bug.target_milestone):
+            newsprint = bug.target_milestone
+        # skip bugs already in the sprint
+        if newsprint and not (bug.sprint and newsprint == bug.sprint.slug):
+            wanted.append((bug, newsprint))
+    if not wanted:
+        return []
+
+    # the projects and sprints for all of the bugs in two queries.
+    projects = defaultdict(set)
+    prodcomps = BZProduct.objects.filter(
+        name__in=set(bug.product for bug, _ in wanted),
+    ).select_related('project')
+    for pc in prodcomps:
+        projects[pc.name, pc.component].add(pc.project)
+    sprints = dict(((sprint.team_id, sprint.slug), sprint)
+                   for sprint in Sprint.objects.filter(
+                       slug__in=set(slug for _, slug in wanted)))
+
+    moves = []
+    for bug, newsprint in wanted:
         newsprint_obj = None
-        proj = None
-        new_projs = instance.projects_from_product()
+        new_projs = (projects[bug.product, bug.component] |
+                     projects[bug.product, ALL_COMPONENTS])
         for proj in new_projs:
-            try:
-                newsprint_obj = Sprint.objects.get(team=proj.team,
-                                                   slug=newsprint)
+            newsprint_obj = sprints.get((proj.team_id, newsprint))
+            if newsprint_obj:
                 break
-            except Sprint.DoesNotExist:
-                continue
-
         if not newsprint_obj:
-            return
+            continue
+        moves.append((bug, bug.sprint, newsprint_obj))
+        bug.sprint = newsprint_obj
+        bug.project = proj
+    return moves
 
-        if instance.sprint:
-            BugSprintLog.objects.removed_from_sprint(instance,
-                                                     instance.sprint)
-        instance.sprint = newsprint_obj
-        instance.project = proj
-        BugSprintLog.objects.added_to_sprint(instance, newsprint_obj)
+
+@receiver(pre_save, sender=Bug)
+def move_to_sprint(sender, instance, **kwargs):
+    BugSprintLog.objects.log_moves(move_to_sprints([instance]))
 
 
 @receiver(pre_save, sender=Sprint)
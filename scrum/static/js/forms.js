@@ -104,5 +104,19 @@ $(function(){
     var toComponent = function(name) {
         return name.split(' :: ');
     };
-    $('#id_product').select2();
+    var $product = $('#id_product');
+    $product.select2({
+        minimumInputLength: 2,
+        ajax: {
+            url: $product.data('url'),
+            dataType: 'json',
+            quietMillis: 250,
+            data: function(term) {
+                return {q: term};
+            },
+            results: function(data) {
+                return data;
+            }
+        }
+    });
 });
@@ -1,10 +1,14 @@
 import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils.timezone import now
 
 from celery import task
 
-from bugzilla.api import bugzilla
-from scrum.models import ALL_COMPONENTS, Bug, store_bugs, Sprint
-from scrum.utils import chunked
+from bugzilla.api import bugzilla, is_overloaded_error
+from scrum.models import ALL_COMPONENTS, Bug, BZProduct, store_bugs, Sprint
+from scrum.utils import chunked, get_setting_or_env
 
 try:
     import newrelic.agent
@@ -13,22 +17,77 @@ except ImportError:
 
 
 log = logging.getLogger(__name__)
+# seconds to wait before fetching queued bugs, so that repeated
+# requests for the same bugs end up in a single fetch.
+UPDATE_BUGS_DELAY = int(get_setting_or_env('UPDATE_BUGS_DELAY', 15))
+# in case a queued task never runs.
+UPDATE_BUGS_QUEUED_FOR = 60 * 10
 
 
 @task(name='update_product')
-def update_product(product, component=None):
+def update_product(product, component=None, full=False):
+    """
+    Update the bugs in a product that changed since it was last synced.
+    :param full: Update all of the bugs regardless of the last sync.
+    """
+    component = component or ALL_COMPONENTS
     kwargs = {'product': product, 'scrum_only': True}
-    if component and component != ALL_COMPONENTS:
+    if component != ALL_COMPONENTS:
         kwargs['component'] = component
-    bug_ids = bugzilla.get_bug_ids(**kwargs)
+    if not full:
+        since = BZProduct.objects.get_sync_watermark(product, component)
+        if since:
+            kwargs['last_change_time'] = since
+    changed = bugzilla.get_bug_change_times(**kwargs)
+    stale = Bug.objects.get_changed_ids(changed)
+    bug_ids = sorted(changed) if full else stale
     log.debug('Updating %d bugs from %s', len(bug_ids), kwargs)
     for bids in chunked(bug_ids, 100):
-        update_bugs.delay(bids)
+        # already known to have changed.
+        queue_update_bugs(bids, check=False)
+    if changed:
+        # only past the bugs that are already stored. the ones just queued
+        # are checked again by the next sync, in case their update fails
+        # or is dropped.
+        if stale:
+            watermark = min(changed[bid] for bid in stale)
+        else:
+            watermark = max(changed.values())
+        BZProduct.objects.set_sync_watermark(product, component, watermark)
+
 
+@task(name='sync_products')
+def sync_products():
+    """
+    Update the changed bugs for every product followed by a project.
+    """
+    for product, components in BZProduct.objects.full_list().items():
+        for component in components:
+            update_product.delay(product, component)
 
-@task(name='update_bugs')
-def update_bugs(bug_ids):
-    bugs = bugzilla.get_bugs(ids=bug_ids, scrum_only=False)
+
+@task(name='update_bugs', max_retries=5, default_retry_delay=2 * 60)
+def update_bugs(bug_ids, force=False, check=True):
+    """
+    Fetch and store the bugs from Bugzilla.
+    :param force: Fetch all of the bugs and all of their history, even if
+                  they are unchanged.
+    :param check: Ask Bugzilla which of the bugs changed first, and only
+                  fetch those.
+    """
+    # bugs requested from now on need a new fetch.
+    cache.delete_many([_queued_bug_key(bid, force) for bid in bug_ids])
+    try:
+        bugs = fetch_bugs(bug_ids, force, check)
+    except Exception as e:
+        if not is_overloaded_error(e):
+            raise
+        # don't lose the chunk; try again once Bugzilla has recovered.
+        log.warning('Bugzilla overloaded (%r), retrying %d bugs later',
+                    e, len(bug_ids))
+        raise update_bugs.retry(exc=e)
+    if bugs is None:
+        return
     for fault in bugs['faults']:
         if fault['faultCode'] == 102:  # unauthorized
             try:
@@ -39,21 +98,141 @@ def update_bugs(bug_ids):
     store_bugs(bugs)
 
 
+def fetch_bugs(bug_ids, force=False, check=True):
+    """
+    Return the Bugzilla data for the bugs, or None if none changed.
+    :param force: Fetch all of the bugs and all of their history, even if
+                  they are unchanged.
+    :param check: Ask Bugzilla which of the bugs changed first, and only
+                  fetch those.
+    """
+    if check and not force:
+        # cheap check first so that the history, comments and attachments
+        # are only fetched for bugs that actually changed.
+        change_times = bugzilla.get_bug_change_times(ids=bug_ids,
+                                                     scrum_only=False)
+        changed = Bug.objects.get_changed_ids(change_times)
+        # bugs missing from the results are faults; fetch them to find out.
+        bug_ids = changed + [bid for bid in bug_ids
+                             if bid not in change_times]
+        if not bug_ids:
+            return None
+    # only the new history of the bugs with some stored. a forced update
+    # fetches all of it.
+    history_times = {} if force else Bug.objects.get_history_times(bug_ids)
+    known = [bid for bid in bug_ids if bid in history_times]
+    unknown = [bid for bid in bug_ids if bid not in history_times]
+    bugs = {'bugs': [], 'faults': []}
+    if unknown:
+        _extend_bugs(bugs, bugzilla.get_bugs(ids=unknown, scrum_only=False))
+    if known:
+        comment_marks = Bug.objects.get_comment_marks(known)
+        known_bugs = bugzilla.get_bugs(
+            ids=known, scrum_only=False,
+            history_since=min(history_times[bid] for bid in known),
+            comments_since=min(t for t, c in comment_marks.values()))
+        count_new_comments(known_bugs['bugs'], comment_marks)
+        _extend_bugs(bugs, known_bugs)
+    return bugs
+
+
+def count_new_comments(bugs, comment_marks):
+    """
+    Set the `comments_count` of bugs fetched with only their new comments
+    by adding those to the stored count.
+
+    Any comment after the stored last change time is new. Bugs whose
+    counts don't add up get a full recount.
+    :param bugs: list of bug data with `new_comments`.
+    :param comment_marks: dict from `Bug.objects.get_comment_marks`.
+    """
+    recount = []
+    for bug in bugs:
+        if 'new_comments' not in bug:
+            continue
+        new_comments = bug.pop('new_comments')
+        since, count = comment_marks.get(bug['id'], (None, 0))
+        if since is not None:
+            new_comments = [c for c in new_comments if c['time'] > since]
+        # every bug has at least its description, and the position of a
+        # new comment can't be before the ones already counted.
+        if since is None or not count or any(c.get('count', count) < count
+                                             for c in new_comments):
+            recount.append(bug)
+        else:
+            bug['comments_count'] = count + len(new_comments)
+    if recount:
+        log.info('Recounting comments of bugs: %s',
+                 [bug['id'] for bug in recount])
+        comments = bugzilla.get_comments([bug['id'] for bug in recount])
+        for bug in recount:
+            bug['comments_count'] = len(comments.get(bug['id'], {})
+                                        .get('comments', []))
+
+
+def _extend_bugs(bugs, more_bugs):
+    for key in ('bugs', 'faults'):
+        bugs[key].extend(more_bugs.get(key, []))
+
+
+def _queued_bug_key(bug_id, force=False):
+    return 'bug:queued:%s%d' % ('force:' if force else '', bug_id)
+
+
+def queue_update_bugs(bug_ids, force=False, check=True):
+    """
+    Queue an `update_bugs` task for the bugs that aren't already queued.
+
+    Bugs are registered in the cache until their update starts, so bugmail,
+    product syncs and refreshes asking for the same bug in the meantime
+    are left to the update that's already queued.
+    :param force: Fetch all of the bugs and all of their history, even if
+                  they are unchanged.
+    :param check: Ask Bugzilla which of the bugs changed first, and only
+                  fetch those.
+    :return: list of the newly queued bug ids.
+    """
+    bug_ids = [bid for bid in sorted(set(int(bid) for bid in bug_ids))
+               if cache.add(_queued_bug_key(bid, force), True,
+                            UPDATE_BUGS_QUEUED_FOR)]
+    if bug_ids:
+        update_bugs.apply_async(args=[bug_ids],
+                                kwargs={'force': force, 'check': check},
+                                countdown=UPDATE_BUGS_DELAY)
+    return bug_ids
+
+
 @task(name='update_sprint_data')
 def update_sprint_data(sprint_ids):
     for sprint in Sprint.objects.filter(id__in=sprint_ids):
         sprint.bugs_data_cache = sprint.get_bugs().get_aggregate_data()
         sprint.save()
+        sprint.update_snapshots()
+
+
+@task(name='snapshot_sprints')
+def snapshot_sprints():
+    """
+    Store today's snapshot of the running sprints, and the final one of
+    yesterday for those that ran then.
+    """
+    today = now().date()
+    yesterday = today - timedelta(days=1)
+    for sprint in Sprint.objects.filter(start_date__lte=today,
+                                        end_date__gte=yesterday):
+        sprint.update_snapshots(days=[yesterday, today])
 
 
-def update_bug_chunks(bugs, chunk_size=100):
+def update_bug_chunks(bugs, chunk_size=100, force=False):
     """
     Update bugs in chunks of `chunk_size`.
     :param bugs: Iterable of bug objects.
+    :param force: Fetch all of the bugs and all of their history, even if
+                  they are unchanged.
     """
     numbugs = 0
     for bchunk in chunked(bugs, chunk_size):
         numbugs += len(bugs)
         log.debug("Updating %d bugs", len(bugs))
-        update_bugs.delay([b.id for b in bchunk])
+        queue_update_bugs([b.id for b in bchunk], force=force)
     log.debug("Total bugs updated: %d", numbugs)
@@ -1,5 +1,7 @@
 from __future__ import absolute_import
 
+import zlib
+from base64 import b64encode
 from copy import deepcopy
 from datetime import date, timedelta
 
@@ -10,8 +12,11 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection, transaction
 from django.test import TestCase
 from django.utils import simplejson as json
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
 
 from scrum import cron as scrum_cron
 from scrum import models as scrum_models
@@ -19,7 +24,8 @@ from scrum import tasks as scrum_tasks
 from scrum.forms import CreateProjectForm, SprintBugsForm
 from scrum.models import BugSprintLog, Bug, BZProduct, Project, Sprint
 from scrum.tasks import update_product
-from scrum.utils import parse_whiteboard
+from scrum.utils import (burndown_totals, daily_values, date_range, date_to_js,
+                         parse_whiteboard)
 
 
 scrum_models.bugzilla = Mock()
@@ -41,8 +47,15 @@ def get_bug_ids_mock(**kwargs):
     return [b['id'] for b in BUG_DATA.copy()['bugs']]
 
 
+def get_bug_change_times_mock(**kwargs):
+    return dict((b['id'], parse_datetime(b['last_change_time']))
+                for b in BUG_DATA['bugs'])
+
+
 scrum_models.bugzilla.get_bug_ids.side_effect = get_bug_ids_mock
 scrum_tasks.bugzilla.get_bug_ids.side_effect = get_bug_ids_mock
+scrum_tasks.bugzilla.get_bug_change_times.side_effect = \
+    get_bug_change_times_mock
 
 
 class TestUtils(TestCase):
@@ -73,6 +86,32 @@ class TestUtils(TestCase):
             'p': '10',
         })
 
+    def test_burndown_totals(self):
+        """burndown_totals() should sum the points of the bugs by day."""
+        sdate = date(2012, 1, 1)
+        story_points = {1: 5, 2: 3, 3: 2}
+        changes = [
+            # before the sprint, then burned down on the third day.
+            (1, date(2011, 12, 30), 8),
+            (1, date(2012, 1, 3), 0),
+            # raised on the first day, then after the last day.
+            (2, date(2012, 1, 1), 5),
+            (2, date(2012, 1, 9), 3),
+        ]
+        expected = [15, 15, 7, 7, 7]
+        eq_(burndown_totals(sdate, 5, story_points, changes), expected)
+        eq_(burndown_totals(sdate, 2, story_points, []), [10, 10])
+
+    def test_daily_values(self):
+        """daily_values() should give the value at the end of each day."""
+        changes = [(date(2011, 12, 30), 'UNCONFIRMED', 'NEW'),
+                   (date(2012, 1, 2), 'NEW', 'ASSIGNED'),
+                   (date(2012, 1, 2), 'ASSIGNED', 'RESOLVED'),
+                   (date(2012, 1, 9), 'RESOLVED', 'VERIFIED')]
+        eq_(daily_values(date(2012, 1, 1), 3, 'VERIFIED', changes),
+            ['NEW', 'RESOLVED', 'RESOLVED'])
+        eq_(daily_values(date(2012, 1, 1), 2, 'NEW', []), ['NEW', 'NEW'])
+
 
 class TestBZProducts(TestCase):
     fixtures = ['test_data.json']
@@ -99,6 +138,36 @@ class TestBZProducts(TestCase):
         self.assertDictEqual(all_prods,
                              {u'Dude': [unicode(scrum_models.ALL_COMPONENTS)]})
 
+    def test_incremental_product_sync(self):
+        """
+        Only bugs changed since the last sync of a product should be fetched.
+        """
+        get_changes = scrum_tasks.bugzilla.get_bug_change_times
+        change_times = get_bug_change_times_mock()
+        newest = max(change_times.values())
+        # a bug that's changed since it was stored.
+        Bug.objects.filter(id=778466).update(
+            last_change_time=parse_datetime('2012-01-01T00:00:00Z'))
+        # saving the product triggers the first sync.
+        BZProduct.objects.create(name='Dude', component='Abiding',
+                                 project=self.p)
+        ok_('last_change_time' not in get_changes.call_args[1])
+        # the watermark only moves past the bug once it's stored.
+        eq_(BZProduct.objects.get_sync_watermark('Dude', 'Abiding'),
+            change_times[778466])
+        update_product('Dude', 'Abiding')
+        eq_(get_changes.call_args[1]['last_change_time'], change_times[778466])
+        eq_(BZProduct.objects.get_sync_watermark('Dude', 'Abiding'), newest)
+        update_product('Dude', 'Abiding')
+        eq_(get_changes.call_args[1]['last_change_time'], newest)
+        update_product('Dude', 'Abiding', full=True)
+        ok_('last_change_time' not in get_changes.call_args[1])
+        # a new project following the product gets a full sync.
+        BZProduct.objects.create(name='Dude', component='Abiding',
+                                 project=Project.objects.create(name='Rug',
+                                                                slug='rug'))
+        ok_('last_change_time' not in get_changes.call_args[1])
+
 
 class TestCron(TestCase):
     fixtures = ['test_data.json']
@@ -129,6 +198,35 @@ class TestBug(TestCase):
                                component=scrum_models.ALL_COMPONENTS)
         update_product('MDN')
 
+    def test_aggregate_data(self):
+        """The aggregates should match summing the points of each bug."""
+        unassigned = Bug.objects.filter(id__in=[781717, 778465]).update(
+            assigned_to=scrum_models.UNASSIGNED_EMAIL, story_points=3)
+        eq_(unassigned, 2)
+        bugs = Bug.objects.all()
+        expected = {
+            'users': {}, 'components': {}, 'status': {}, 'basic_status': {},
+            'total_points': 0, 'total_bugs': len(bugs), 'scoreless_bugs': 0,
+        }
+        for bug in bugs:
+            if not bug.story_points:
+                expected['scoreless_bugs'] += 1
+                continue
+            for name, key in [('users', bug.story_user),
+                              ('components', bug.real_component),
+                              ('status', bug.status),
+                              ('basic_status', bug.basic_status)]:
+                expected[name][key] = (expected[name].get(key, 0) +
+                                       bug.story_points)
+            expected['total_points'] += bug.story_points
+        expected['points_remaining'] = (
+            expected['total_points'] -
+            expected['basic_status'].get('closed', 0))
+        ok_(expected['total_points'])
+        ok_(expected['scoreless_bugs'])
+        ok_(len(expected['basic_status']) > 1)
+        eq_(bugs.get_aggregate_data(), expected)
+
     def test_has_scrum_data(self):
         """
         A bug with u= or c= or p= with no data should still show up.
@@ -136,6 +234,238 @@ class TestBug(TestCase):
         b = Bug.objects.get(id=784492)
         ok_(b.has_scrum_data)
 
+    def test_has_scrum_data_saved(self):
+        """
+        The flag should follow the whiteboard so scrum_only() can use it.
+        """
+        b = Bug.objects.get(id=784492)
+        b.whiteboard = '[qawanted]'
+        b.save()
+        ok_(not Bug.objects.get(id=784492).has_scrum_data)
+        ok_(b not in Bug.objects.scrum_only())
+        b.whiteboard = '[qawanted] p=2'
+        b.save()
+        ok_(b in Bug.objects.scrum_only())
+
+    def test_unchanged_bugs_not_fetched(self):
+        """
+        Bugs unchanged since they were stored should not be fetched again.
+        """
+        get_bugs = scrum_tasks.bugzilla.get_bugs
+        get_bugs.reset_mock()
+        scrum_tasks.update_bugs([778465, 778466])
+        ok_(not get_bugs.called)
+        last_change_time = parse_datetime('2012-01-01T00:00:00Z')
+        Bug.objects.filter(id=778466).update(
+            last_change_time=last_change_time)
+        scrum_tasks.update_bugs([778465, 778466])
+        get_bugs.assert_called_once_with(
+            ids=[778466], scrum_only=False,
+            history_since=Bug.objects.get(id=778466).history_time,
+            comments_since=last_change_time)
+        get_bugs.reset_mock()
+        scrum_tasks.update_bugs([778465], force=True)
+        get_bugs.assert_called_once_with(ids=[778465], scrum_only=False)
+
+    def test_product_sync_fetches_new_history(self):
+        """
+        Product syncs should only fetch the new history of stored bugs,
+        without checking again which of them changed.
+        """
+        get_bugs = scrum_tasks.bugzilla.get_bugs
+        get_changes = scrum_tasks.bugzilla.get_bug_change_times
+        last_change_time = parse_datetime('2012-01-01T00:00:00Z')
+        Bug.objects.filter(id=778466).update(
+            last_change_time=last_change_time)
+        get_bugs.reset_mock()
+        get_changes.reset_mock()
+        update_product('MDN')
+        eq_(get_changes.call_count, 1)
+        get_bugs.assert_called_once_with(
+            ids=[778466], scrum_only=False,
+            history_since=Bug.objects.get(id=778466).history_time,
+            comments_since=last_change_time)
+
+    def test_history_appended(self):
+        """A sync should only store the history entries that are new."""
+        data = deepcopy(BUG_DATA['bugs'][0])
+        history = data['history']
+        ok_(len(history) > 2)
+        data['history'] = history[:-1]
+        Bug.objects.filter(id=data['id']).delete()
+        Bug.objects.update_or_create(deepcopy(data))
+        bug = Bug.objects.get(id=data['id'])
+        eq_(bug.history_count, len(history) - 1)
+        eq_(bug.history_base, [])
+        data['history'] = history
+        Bug.objects.update_or_create(deepcopy(data))
+        chunks = bug.history_chunks.all()
+        eq_([c.start for c in chunks], [0, len(history) - 1])
+        eq_(chunks[1].entries, history[-1:])
+        eq_(Bug.objects.get(id=data['id']).history, history)
+        # bugs from before the chunks keep their history blob.
+        Bug.objects.filter(id=data['id']).update(history_count=None)
+        bug.history_chunks.all().delete()
+        bug = Bug.objects.get(id=data['id'])
+        bug.history_base = history[:2]
+        bug.save(update_fields=['history_base'])
+        Bug.objects.update_or_create(deepcopy(data))
+        bug = Bug.objects.get(id=data['id'])
+        eq_(bug.history_base, history[:2])
+        eq_(bug.history, history)
+        # a shorter history means it was rewritten.
+        data['history'] = history[:1]
+        Bug.objects.update_or_create(deepcopy(data))
+        bug = Bug.objects.get(id=data['id'])
+        eq_(bug.history_base, [])
+        eq_(bug.history, history[:1])
+        eq_(bug.history_chunks.count(), 1)
+
+    def test_new_history_appended(self):
+        """Only history newer than what's stored should be added."""
+        data = deepcopy(BUG_DATA['bugs'][0])
+        history = data.pop('history')
+        bug = Bug.objects.get(id=data['id'])
+        eq_(bug.history_time, scrum_models.history_entry_time(history[-1]))
+        ok_(bug.history_time in Bug.objects.get_history_times([data['id']])
+                                           .values())
+        new_entry = deepcopy(history[-1])
+        new_entry['when'] = bug.history_time + timedelta(days=1)
+        # fetched since an older time, so some entries are already stored.
+        data['new_history'] = history[-2:] + [new_entry]
+        Bug.objects.update_or_create(deepcopy(data))
+        bug = Bug.objects.get(id=data['id'])
+        eq_(bug.history_count, len(history) + 1)
+        eq_(bug.history_time, new_entry['when'])
+        eq_(bug.history_chunks.all()[1].start, len(history))
+        eq_(len(bug.history), len(history) + 1)
+
+    @patch.object(scrum_models, 'HISTORY_MAX_CHUNKS', 2)
+    def test_history_chunks_merged(self):
+        """A bug should never have more than HISTORY_MAX_CHUNKS chunks."""
+        bug = Bug.objects.get(id=781717)
+        history = bug.history
+        eq_(bug.history_chunk_count, 1)
+        for i in range(3):
+            entry = deepcopy(history[-1])
+            entry['when'] = bug.history_time + timedelta(days=1)
+            bug.append_history([entry])
+            bug.save()
+            history = history + [entry]
+            bug = Bug.objects.get(id=781717)
+            ok_(bug.history_chunks.count() <= 2)
+            eq_(bug.history_chunks.count(), bug.history_chunk_count)
+            eq_([scrum_models.history_entry_time(h) for h in bug.history],
+                [scrum_models.history_entry_time(h) for h in history])
+        eq_(bug.history_chunk_count, 2)
+        eq_([c.start for c in bug.history_chunks.all()],
+            [0, len(history) - 1])
+
+    def test_compressed_json_storage(self):
+        """
+        Blobs should be stored as tagged bytes, or as plain JSON when that is
+        smaller, decoded when used, and only encoded again when they change.
+        Old base64 rows should still load.
+        """
+        attachments = [{'id': 1, 'file_name': 'patch.diff', 'flags': []}]
+        cursor = connection.cursor()
+        cursor.execute('UPDATE scrum_bug SET attachments = %s WHERE id = %s',
+                       [b64encode(zlib.compress(json.dumps(attachments), 9)),
+                        778465])
+        bug = Bug.objects.get(id=778465)
+        ok_(isinstance(bug.__dict__['flags'], scrum_models.StoredJSON))
+        eq_(bug.attachments, attachments)
+        with patch.object(scrum_models.CompressedJSONField,
+                          'encode') as encode:
+            bug.flags
+            bug.save()
+            ok_(not encode.called)
+        bug.attachments.extend({'id': i, 'file_name': 'patch.diff',
+                                'flags': []} for i in range(2, 21))
+        bug.flags = []
+        bug.save()
+        bug = Bug.objects.get(id=778465)
+        ok_(bug.__dict__['attachments'].raw[:1] in
+            scrum_models.JSON_CODEC_TAGS)
+        eq_(bytes(bug.__dict__['flags'].raw), '[]')
+        eq_(len(bug.attachments), 20)
+        eq_(bug.flags, [])
+
+    def test_points_changes_stored(self):
+        """The points timeline should be stored when the history changes."""
+        bug = Bug.objects.get(id=781717)
+        timeline = scrum_models.get_points_timeline(bug.history)
+        ok_(timeline)
+        eq_(Bug.objects.get(id=781717).points_history, timeline)
+        closed = {'when': bug.history_time + timedelta(days=1),
+                  'changes': [{'field_name': 'bug_status', 'removed': 'NEW',
+                               'added': 'RESOLVED'}]}
+        bug.append_history([closed])
+        bug.save()
+        bug = Bug.objects.get(id=781717)
+        eq_(len(bug.points_history), len(timeline) + 1)
+        eq_(bug.points_history[-1],
+            {'date': closed['when'].date(), 'points': 0})
+        eq_(bug.points_for_date(closed['when'].date()), 0)
+
+    @patch.object(scrum_tasks.bugzilla, 'get_comments')
+    def test_new_comments_counted(self, get_comments):
+        """New comments should be added to the stored count."""
+        since = parse_datetime('2012-08-28T14:07:44Z')
+        marks = {1: (since, 5), 2: (since, 5), 3: (None, 0)}
+        bugs = [
+            {'id': 1, 'new_comments': [
+                {'time': since, 'count': 4},
+                {'time': since + timedelta(hours=1), 'count': 5}]},
+            # a comment counted again means the count is off.
+            {'id': 2, 'new_comments': [
+                {'time': since + timedelta(hours=1), 'count': 3}]},
+            {'id': 3, 'new_comments': []},
+        ]
+        get_comments.return_value = {2: {'comments': [{'id': 1}] * 4},
+                                     3: {'comments': [{'id': 2}] * 2}}
+        scrum_tasks.count_new_comments(bugs, marks)
+        eq_([b['comments_count'] for b in bugs], [6, 4, 2])
+        get_comments.assert_called_once_with([2, 3])
+        ok_(not any('new_comments' in b for b in bugs))
+
+    @patch.object(scrum_tasks.bugzilla, 'get_comments')
+    def test_product_sync_counts_new_comments(self, get_comments):
+        """Product syncs should only fetch and count the new comments."""
+        since = parse_datetime('2012-01-01T00:00:00Z')
+        bug = Bug.objects.get(id=778466)
+        Bug.objects.filter(id=bug.id).update(last_change_time=since)
+        data = deepcopy([b for b in BUG_DATA['bugs']
+                         if b['id'] == bug.id][0])
+        del data['comments_count']
+        data['new_history'] = []
+        data['new_comments'] = [
+            {'time': since + timedelta(days=1), 'count': bug.comments_count},
+            {'time': since + timedelta(days=2),
+             'count': bug.comments_count + 1}]
+        with patch.object(scrum_tasks.bugzilla, 'get_bugs') as get_bugs:
+            get_bugs.return_value = {'bugs': [data], 'faults': []}
+            update_product('MDN')
+        eq_(get_bugs.call_args[1]['comments_since'], since)
+        eq_(Bug.objects.get(id=bug.id).comments_count,
+            bug.comments_count + 2)
+        ok_(not get_comments.called)
+
+    @patch.object(scrum_tasks.update_bugs, 'apply_async')
+    def test_queued_bugs_coalesced(self, apply_async):
+        """Bugs that are already queued for an update are not queued again."""
+        eq_(scrum_tasks.queue_update_bugs([778466, 778465, 778465]),
+            [778465, 778466])
+        eq_(scrum_tasks.queue_update_bugs([778465, 781710]), [781710])
+        eq_(scrum_tasks.queue_update_bugs([778465]), [])
+        eq_(apply_async.call_count, 2)
+        eq_(apply_async.call_args[1]['args'], [[781710]])
+        # forced updates aren't left to unforced ones.
+        eq_(scrum_tasks.queue_update_bugs([778465], force=True), [778465])
+        # once the update starts the bugs can be queued again.
+        scrum_tasks.update_bugs([778465, 778466])
+        eq_(scrum_tasks.queue_update_bugs([778465, 781710]), [778465])
+
     def test_scrum_data_c_defaults_component(self):
         """
         A bug with no or blank c= should use BZ component.
@@ -241,10 +571,94 @@ class TestBug(TestCase):
         self.assertSetEqual(set([781718, 781715, 781717, 781718]),
                             set(Bug.objects.get_blocked().keys()))
 
+    def test_dependencies_stored(self):
+        """The dependencies should follow depends_on when bugs are stored."""
+        eq_(set(Bug.objects.get(id=781714).blocker_deps
+                   .values_list('blocker_id', flat=True)),
+            set([781709, 781721]))
+        bug = Bug.objects.get(id=778466)
+        data = {'id': bug.id, 'depends_on': [999999]}
+        scrum_models.store_bugs({'bugs': [data]})
+        eq_(list(bug.blocker_deps.values_list('blocker_id', flat=True)),
+            [999999])
+        # a blocker that isn't stored doesn't count.
+        ok_(bug.id not in Bug.objects.get_blocked())
+
+    def test_dependencies_kept_when_blocker_deleted(self):
+        """Deleting a blocker should leave the bugs it blocks alone."""
+        Bug.objects.get(id=778465).delete()
+        eq_(list(Bug.objects.get(id=778466).blocker_deps
+                    .values_list('blocker_id', flat=True)),
+            [778465])
+        ok_(778466 not in Bug.objects.get_blocked())
+
     def test_flagged_bugs(self):
         self.assertSetEqual(set([778465, 781710, 781717]),
                             set(Bug.objects.get_flagged()))
 
+    def test_flags_summary_stored(self):
+        """The flags summary should follow the flags when bugs are stored."""
+        scrum_models.store_bugs({'bugs': [
+            {'id': 781710, 'flags': [], 'attachments': []},
+            {'id': 778466, 'flags': [{'name': 'needinfo', 'status': '?'},
+                                     {'name': 'needinfo', 'status': '+'}]},
+        ]})
+        self.assertSetEqual(set([778465, 778466, 781717]),
+                            set(Bug.objects.get_flagged()))
+        eq_(Bug.objects.get(id=778466).flags_status, {'needinfo': 'mixed'})
+        eq_(Bug.objects.get(id=781710).flags_status, {})
+
+    def test_bugs_stored_in_bulk(self):
+        """Storing bugs together should be the same as one at a time."""
+        def stored_bugs():
+            bugs = {}
+            for bug in Bug.objects.all():
+                fields = dict((f.name, getattr(bug, f.name))
+                              for f in bug._meta.fields
+                              if f.name != 'last_synced_time')
+                moves = list(bug.sprint_actions.order_by('id')
+                                .values_list('sprint_id', 'action'))
+                bugs[bug.id] = (fields, bug.history, bug.points_history,
+                                moves)
+            return bugs
+
+        bugs_data = deepcopy(BUG_DATA['bugs'])
+        # a sprint move, new history, rewritten history and a new bug.
+        bugs_data[0]['whiteboard'] += ' s=2.2'
+        closed = {'when': '2013-01-01T00:00:00Z',
+                  'changes': [{'field_name': 'bug_status', 'removed': 'NEW',
+                               'added': 'RESOLVED'}]}
+        bugs_data[1]['new_history'] = [closed]
+        bugs_data[2]['history'] = bugs_data[2]['history'][:1]
+        bugs_data.append(dict(deepcopy(bugs_data[3]), id=999999))
+        savepoint = transaction.savepoint()
+        for data in deepcopy(bugs_data):
+            Bug.objects.update_or_create(data)
+        expected = stored_bugs()
+        transaction.savepoint_rollback(savepoint)
+        cache.clear()
+        bugs = scrum_models.store_bugs({'bugs': deepcopy(bugs_data)})
+        eq_([bug.id for bug in bugs], [data['id'] for data in bugs_data])
+        eq_(stored_bugs(), expected)
+        eq_(Bug.objects.get(id=778465).sprint, self.s)
+        for data in bugs_data:
+            ok_(cache.get('bug:updated:%s' % data['id']))
+
+    def test_changed_bugs_updated_together(self):
+        """Changes to several stored bugs should be saved in one update."""
+        bugs_data = [{'id': bid, 'summary': 'Changed %s' % bid}
+                     for bid in (778465, 778466, 781714)]
+        bugs_data[0]['priority'] = 'P1'
+        bugs_data.append({'id': 781710})
+        with self.assertNumQueries(2):
+            Bug.objects.update_or_create_many(bugs_data)
+        eq_(dict(Bug.objects.filter(id__in=[778465, 778466, 781714])
+                            .values_list('id', 'summary')),
+            dict((bid, 'Changed %s' % bid)
+                 for bid in (778465, 778466, 781714)))
+        eq_(Bug.objects.get(id=778465).priority, 'P1')
+        ok_(Bug.objects.get(id=778466).priority != 'P1')
+
     def test_bugs_with_attachments(self):
         b = Bug.objects.get(id=778465)
         self.assertSetEqual(set(['review', 'feedback', 'superreview', 'ui-review']),
@@ -384,6 +798,77 @@ class TestSprint(TestCase):
         action = Bug.objects.all()[0].sprint_actions.all()[0].action
         self.assertEqual(action, BugSprintLog.ADDED)
 
+    def test_burndown(self):
+        """The burndown should match the points of each bug for each day."""
+        self.s.update_bugs(Bug.objects.all())
+        bugs = list(self.s.get_bugs())
+        expected = [[date_to_js(cdate),
+                     sum(bug.points_for_date(cdate) for bug in bugs)]
+                    for cdate in date_range(self.s.start_date,
+                                            self.s.end_date)]
+        ok_(any(points for _, points in expected))
+        eq_(self.s.get_burndown(), expected)
+
+    def test_burndown_snapshots(self):
+        """The burndown should be read from the stored snapshots."""
+        self.s.update_bugs(Bug.objects.all())
+        burndown = self.s.get_burndown()
+        eq_(self.s.snapshots.count(), len(burndown))
+        self.s.snapshots.update(points_remaining=1)
+        eq_(set(points for _, points in self.s.get_burndown()), set([1]))
+
+    def test_burndown_not_stored_when_read(self):
+        """Days without a snapshot should be worked out, but not stored."""
+        self.s.update_bugs(Bug.objects.all())
+        burndown = self.s.get_burndown()
+        self.s.snapshots.all().delete()
+        eq_(self.s.get_burndown(), burndown)
+        eq_(self.s.snapshots.count(), 0)
+
+    def test_past_snapshots_from_history(self):
+        """The totals of past days should be those of the bugs on the day."""
+        today = now().date()
+        sprint = self.s.team.sprints.create(
+            name='Past', slug='past', start_date=today - timedelta(days=3),
+            end_date=today + timedelta(days=3))
+        closed = now() - timedelta(days=2)
+        bug = Bug.objects.get(id=778465)
+        bug.status = 'RESOLVED'
+        bug.whiteboard = 'u=dev p=5'
+        bug.creation_time = now() - timedelta(days=5)
+        bug.history = [{
+            'when': closed.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'changes': [{'field_name': 'bug_status', 'removed': 'NEW',
+                         'added': 'RESOLVED'},
+                        {'field_name': 'status_whiteboard',
+                         'removed': 'u=dev p=2', 'added': 'u=dev p=5'}]}]
+        bug.save()
+        new_bug = Bug.objects.get(id=778466)
+        new_bug.creation_time = now() - timedelta(days=1)
+        new_bug.save()
+        sprint.update_bugs(Bug.objects.filter(id__in=[bug.id, new_bug.id]))
+        eq_([(s.total_points, s.total_bugs, s.status)
+             for s in sprint.snapshots.all()],
+            [(2, 1, {'NEW': 1}),
+             (5, 1, {'RESOLVED': 1}),
+             (5 + new_bug.story_points, 2,
+              {'RESOLVED': 1, new_bug.status: 1}),
+             (5 + new_bug.story_points, 2,
+              {'RESOLVED': 1, new_bug.status: 1})])
+
+    def test_snapshot_sprints(self):
+        """The nightly task should replace yesterday's and today's snapshots."""
+        today = now().date()
+        self.s.start_date = today - timedelta(days=3)
+        self.s.end_date = today + timedelta(days=3)
+        self.s.save()
+        self.s.update_bugs(Bug.objects.all())
+        self.s.get_burndown()
+        self.s.snapshots.update(points_remaining=1000)
+        scrum_tasks.snapshot_sprints()
+        eq_([s.points_remaining == 1000 for s in self.s.snapshots.all()],
+            [True, True, False, False])
+
     def test_sprint_bug_move_logging(self):
         self.s.update_bugs(self.p.get_backlog())
         newsprint = Sprint.objects.create(
@@ -56,6 +56,8 @@ def get_setting_or_env(name, default=None):
 
 
 WB_SPLIT_RE = re.compile(r'[\[\], ]+')
+# any of these in the whiteboard means the bug is tracked here.
+SCRUM_DATA_TAGS = ('u=', 'c=', 'p=', 's=')
 
 
 def parse_whiteboard(wb):
@@ -65,6 +67,10 @@ def parse_whiteboard(wb):
     return {}
 
 
+def whiteboard_has_scrum_data(wb):
+    return any(tag in wb for tag in SCRUM_DATA_TAGS)
+
+
 def get_story_data(wb):
     wb_dict = {
         'points': 0,
@@ -125,6 +131,60 @@ def date_to_js(date):
     return timegm(date.timetuple()) * 1000
 
 
+def burndown_totals(sdate, num_days, story_points, changes):
+    """
+    Return the total points of the bugs for each of `num_days` days from
+    `sdate`, in one pass over the points changes.
+
+    A bug has the points of its last change on or before a day, or its
+    current points before its first change (see `Bug.points_for_date`).
+
+    :param story_points: dict of bug id to its current points.
+    :param changes: list of (bug id, date, points) tuples, in order for
+                    each bug.
+    :return: list of ints.
+    """
+    # each change adds its difference from the previous points to every
+    # day from its own on.
+    deltas = [0] * num_days
+    prev_points = {}
+    for bid, cdate, points in changes:
+        prev = prev_points.get(bid, story_points[bid])
+        prev_points[bid] = points
+        day = max((cdate - sdate).days, 0)
+        if day < num_days:
+            deltas[day] += points - prev
+    totals = []
+    total = sum(story_points.itervalues())
+    for delta in deltas:
+        total += delta
+        totals.append(total)
+    return totals
+
+
+def daily_values(sdate, num_days, current, changes):
+    """
+    Return the value of a bug field at the end of each of `num_days` days
+    from `sdate`, from the changes in its history.
+
+    A day has the value removed by the first change after it, or `current`
+    if there is none.
+
+    :param current: the value now.
+    :param changes: list of (date, removed, added) tuples, in the order
+                    they happened.
+    :return: list of values.
+    """
+    values = []
+    i = 0
+    for day in range(num_days):
+        cdate = sdate + relativedelta(days=day)
+        while i < len(changes) and changes[i][0] <= cdate:
+            i += 1
+        values.append(changes[i][1] if i < len(changes) else current)
+    return values
+
+
 def make_sha1_key(key, key_prefix, version):
     """A cache key generating function that uses a sha1 hash."""
     prekey = ':'.join([key_prefix, str(version), smart_str(key)])
@@ -151,25 +151,13 @@ class ListProjectsView(ProjectsMixin, ListView):
     context_object_name = 'projects'
 
 
-class EditProjectMixin(object):
-    def get_context_data(self, **kwargs):
-        context = super(EditProjectMixin, self).get_context_data(**kwargs)
-        bz_prod_choices = []
-        for prod, comps in bugzilla.get_products_simplified().items():
-            comps.insert(0, '__ALL__')
-            for comp in comps:
-                bz_prod_choices.append('%s :: %s' % (prod, comp))
-        context['bz_product_choices'] = bz_prod_choices
-        return context
-
-
-class CreateProjectView(EditProjectMixin, ProjectsMixin, ProtectedCreateView):
+class CreateProjectView(ProjectsMixin, ProtectedCreateView):
     model = Project
     form_class = CreateProjectForm
     template_name = 'scrum/project_form.html'
 
 
-class EditProjectView(EditProjectMixin, ProjectsMixin, ProtectedUpdateView):
+class EditProjectView(ProjectsMixin, ProtectedUpdateView):
     form_class = ProjectForm
     template_name = 'scrum/project_form.html'
 
@@ -17,6 +17,7 @@ else:
 
 BUGZILLA_ALL_URLS = {
     'BUGZILLA_API_URL': '/xmlrpc.cgi',
+    'BUGZILLA_JSONRPC_URL': '/jsonrpc.cgi',
     'BUGZILLA_SHOW_URL': '/show_bug.cgi?',
     'BUGZILLA_FILE_URL': '/enter_bug.cgi?',
     'BUGZILLA_SEARCH_URL': '/buglist.cgi?',
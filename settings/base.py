@@ -3,6 +3,7 @@ from datetime import timedelta
 from django.utils.functional import lazy
 
 import djcelery
+from celery.schedules import crontab
 from unipath import Path
 
 
@@ -20,6 +21,12 @@ MANAGERS = ADMINS
 
 BUGZILLA_BASE_URL = 'https://bugzilla.mozilla.org'
 CACHE_BUGS_FOR = 4  # hours
+# how the bug history, flags and attachments are compressed in the db.
+# 'zlib', 'none' or 'lz4' (needs the lz4 package).
+COMPRESSED_JSON_CODEC = 'zlib'
+COMPRESSED_JSON_LEVEL = 6
+# a bug's history chunks are merged into one once it has this many.
+HISTORY_MAX_CHUNKS = 10
 
 SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 MESSAGE_STORAGE = 'django.contrib.messages.storage.fallback.FallbackStorage'
@@ -186,6 +193,14 @@ CELERYBEAT_SCHEDULE = {
         'task': 'clean_bugmail_log',
         'schedule': timedelta(days=5),
     },
+    'sync-products': {
+        'task': 'sync_products',
+        'schedule': timedelta(minutes=30),
+    },
+    'snapshot-sprints': {
+        'task': 'snapshot_sprints',
+        'schedule': crontab(hour=0, minute=5),
+    },
 }
 
 BUG_OPEN_STATUSES = [